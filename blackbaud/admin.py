@@ -5,26 +5,56 @@ from django.http.request import HttpRequest
 
 import humanize
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils import timezone
+from django.utils.html import format_html
 from django.utils.translation import gettext as _
 
 from solo.admin import SingletonModelAdmin
 
 
 from . import models
+from .diffs import format_diff
+from .snapshots import Snapshot, SnapshotError, latest_snapshot
+from .sync import dry_run
+
+
+class SyncRunInline(admin.TabularInline):
+    """Recent sync runs, linking through to their per-phase timings"""
+
+    model = models.SyncRun
+    readonly_fields = ("started_at", "duration", "incremental", "success", "error")
+    fields = readonly_fields
+    show_change_link = True
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(models.SyncConfig)
 class SyncConfigAdmin(SingletonModelAdmin):
+    inlines = [SyncRunInline]
     fields = [
         "sync_enabled",
         "sync_asap",
         "teacher_group",
         "last_sync_attempt",
+        "last_full_sync",
         "get_sync_delay",
+        "get_dry_run_links",
+    ]
+    readonly_fields = [
+        "last_sync_attempt",
+        "last_full_sync",
+        "get_sync_delay",
+        "get_dry_run_links",
     ]
-    readonly_fields = ["last_sync_attempt", "get_sync_delay"]
 
     @admin.display(description="Time until next sync")
     def get_sync_delay(self, obj: models.SyncConfig):
@@ -33,6 +63,69 @@ class SyncConfigAdmin(SingletonModelAdmin):
 
         return humanize.naturaldelta(obj.next_sync - timezone.now())
 
+    @admin.display(description="Dry run")
+    def get_dry_run_links(self, obj: models.SyncConfig):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("admin:blackbaud_syncconfig_dry_run"),
+            _("Diff latest snapshot"),
+        )
+
+    def get_urls(self):
+        urls = [
+            path(
+                "dry-run/",
+                self.admin_site.admin_view(self.dry_run_view),
+                name="blackbaud_syncconfig_dry_run",
+            )
+        ]
+
+        return urls + super().get_urls()
+
+    def dry_run_view(self, request: HttpRequest):
+        """Show the changes a sync of the latest snapshot would make, without
+        writing anything
+
+        Downloading the roster takes longer than a request is allowed to,
+        so a live diff is left to the sis_diff command"""
+
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
+        change_url = reverse("admin:blackbaud_syncconfig_change")
+
+        snapshot_path = latest_snapshot()
+        if not snapshot_path:
+            messages.warning(
+                request,
+                _(
+                    "There are no saved snapshots to diff. "
+                    "Run manage.py sis_diff to diff against the SIS directly."
+                ),
+            )
+            return redirect(change_url)
+
+        try:
+            snapshot = Snapshot.load(snapshot_path)
+        except SnapshotError as exc:
+            messages.error(request, str(exc))
+            return redirect(change_url)
+
+        diffs, metrics = dry_run(snapshot)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": _("Sync dry run"),
+            "snapshot_path": snapshot_path,
+            "lines": [line for diff in diffs for line in format_diff(diff, 50)],
+            "phases": metrics.phases.values(),
+        }
+
+        return TemplateResponse(
+            request, "admin/blackbaud/syncconfig/dry_run.html", context
+        )
+
 
 class NoAdd(admin.ModelAdmin):
     """Block addition"""
@@ -75,6 +168,38 @@ class ReadOnly(NoAdd, NoDelete, NoChange):
     """Read only permissions"""
 
 
+class SyncPhaseInline(admin.TabularInline):
+    model = models.SyncPhase
+    readonly_fields = (
+        "name",
+        "download_seconds",
+        "pages",
+        "bytes",
+        "transform_seconds",
+        "write_seconds",
+        "rows",
+        "added",
+        "changed",
+        "deactivated",
+    )
+    fields = readonly_fields
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.SyncRun)
+class SyncRunAdmin(ReadOnly):
+    """Sync history, with the timings of each phase"""
+
+    inlines = [SyncPhaseInline]
+    list_display = ["started_at", "duration", "incremental", "success"]
+    list_filter = ["success", "incremental"]
+    fields = ["started_at", "finished_at", "incremental", "success", "error"]
+
+
 @admin.register(models.School)
 class SchoolAdmin(ReadOnly):
     """Read-only school admin"""
@@ -273,3 +398,17 @@ class AdvisorySchoolAdmin(admin.ModelAdmin):
     @admin.decorators.display(description="School active", boolean=True)
     def school_active(self, obj: models.AdvisorySchool) -> bool:
         return obj.school.active
+
+
+@admin.register(models.AdvisoryPair)
+class AdvisoryPairAdmin(ReadOnly):
+    """Advisory pairs, as rebuilt by the sync"""
+
+    list_display = ["teacher", "student", "begin_date", "end_date"]
+    list_select_related = ["teacher", "student"]
+    search_fields = [
+        "teacher__family_name",
+        "teacher__given_name",
+        "student__family_name",
+        "student__given_name",
+    ]
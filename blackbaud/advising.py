@@ -1,7 +1,10 @@
 """Advisory helper methods"""
 
+from bisect import bisect_left, bisect_right
 from datetime import date
+import hashlib
 from typing import Iterable, NamedTuple, Optional
+from uuid import uuid4
 
 from blackbaud.models import (
     School,
@@ -10,12 +13,18 @@ from blackbaud.models import (
     Student,
     Course,
     Class,
-    TeacherEnrollment,
+    AdvisoryPair,
 )
 
-from django.db.models import QuerySet
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.functions import Greatest, Least
 from django.utils import timezone
 
+CACHE_VERSION_KEY = "blackbaud:advisees:version"
+
 
 class AdviseePair(NamedTuple):
     student: Student
@@ -47,57 +56,198 @@ def get_advisees(
     limit_students: Optional[Iterable[Student]] = None,
     as_of: Optional[date] = None,
 ) -> set[AdviseePair]:
-    """Get the advisee/advisor pairs for a given set of students and/or teachers"""
+    """Get the advisee/advisor pairs for a given set of students and/or teachers
+
+    The limits apply to the pairs themselves, so limiting to a teacher only
+    gives the students they advise on the date. Before the pairs were stored,
+    the limits picked whole advisory sections, so a teacher with any enrollment
+    in a section, even a past one, got every current pair in it, including the
+    pairs of a co-advisor.
+
+    Results are cached until the advisory pairs are next rebuilt or the SIS is
+    next synced, which is when the teachers and students themselves change. A
+    per-process cache only sees that in the process that did it, so other
+    processes hold on to their results for up to ADVISEES_CACHE_TIMEOUT."""
 
     if not as_of:
         as_of = timezone.now().date()
 
-    advisory_sections = get_advisory_sections().prefetch_related(
-        "students",
-        "teachers",
-        "student_enrollments",
-        "teacher_enrollments",
-        "student_enrollments__student",
-        "teacher_enrollments__teacher",
+    teacher_ids = _ids(limit_teachers)
+    student_ids = _ids(limit_students)
+
+    key = _cache_key(teacher_ids, student_ids, as_of)
+    cached = cache.get(key)
+    if cached is not None:
+        return set(cached)
+
+    pairs = _advisory_pairs(teacher_ids, student_ids, as_of, as_of)
+
+    out = {AdviseePair(student=pair.student, teacher=pair.teacher) for pair in pairs}
+    cache.set(key, out, settings.ADVISEES_CACHE_TIMEOUT)
+
+    return out
+
+
+def get_advisees_for_dates(
+    dates: Iterable[date],
+    limit_teachers: Optional[Iterable[Teacher]] = None,
+    limit_students: Optional[Iterable[Student]] = None,
+) -> dict[date, set[AdviseePair]]:
+    """Get the advisee/advisor pairs on each of the given dates
+
+    Every pair that overlaps the span of the dates is loaded in a single
+    query, and then placed on the dates it covers with a binary search"""
+
+    ordered_dates = sorted(set(dates))
+    out: dict[date, set[AdviseePair]] = {d: set() for d in ordered_dates}
+
+    if not ordered_dates:
+        return out
+
+    pairs = _advisory_pairs(
+        _ids(limit_teachers),
+        _ids(limit_students),
+        ordered_dates[0],
+        ordered_dates[-1],
     )
 
-    school_students = Student.objects.filter(schools__in=get_advisory_schools())
-    advisory_sections = advisory_sections.filter(students__in=school_students)
-
-    if limit_teachers is not None:
-        advisory_sections = advisory_sections.filter(teachers__in=limit_teachers)
-
-    if limit_students is not None:
-        advisory_sections = advisory_sections.filter(students__in=limit_students)
-
-    pairs: set[AdviseePair] = set()
-
-    for section in advisory_sections:
-        for teacher_enrollment in section.teacher_enrollments.all():
-            assert isinstance(teacher_enrollment, TeacherEnrollment)
-            if (
-                teacher_enrollment.begin_date <= as_of
-                and as_of <= teacher_enrollment.end_date
-                and teacher_enrollment.active
-            ):
-                for student_enrollment in section.student_enrollments.all():
-                    assert isinstance(student_enrollment, StudentEnrollment)
-
-                    if (
-                        student_enrollment.begin_date <= as_of
-                        and as_of <= student_enrollment.end_date
-                        and student_enrollment.active
-                    ):
-                        pairs.add(
-                            AdviseePair(
-                                teacher=teacher_enrollment.teacher,
-                                student=student_enrollment.student,
-                            )
-                        )
+    for pair in pairs:
+        advisee_pair = AdviseePair(student=pair.student, teacher=pair.teacher)
+        start = bisect_left(ordered_dates, pair.begin_date)
+        end = bisect_right(ordered_dates, pair.end_date)
+
+        for d in ordered_dates[start:end]:
+            out[d].add(advisee_pair)
+
+    return out
+
+
+def _advisory_pairs(
+    teacher_ids: Optional[tuple[int, ...]],
+    student_ids: Optional[tuple[int, ...]],
+    begin_date: date,
+    end_date: date,
+) -> QuerySet[AdvisoryPair]:
+    """Advisory pairs that overlap a date range"""
+
+    pairs = AdvisoryPair.objects.filter(
+        begin_date__lte=end_date,
+        end_date__gte=begin_date,
+    ).select_related("teacher", "student")
+
+    if teacher_ids is not None:
+        pairs = pairs.filter(teacher_id__in=teacher_ids)
+
+    if student_ids is not None:
+        pairs = pairs.filter(student_id__in=student_ids)
 
     return pairs
 
 
+def _ids(objs: Optional[Iterable[Teacher | Student]]) -> Optional[tuple[int, ...]]:
+    if objs is None:
+        return None
+
+    return tuple(sorted({obj.pk for obj in objs}))
+
+
+def _cache_key(
+    teacher_ids: Optional[tuple[int, ...]],
+    student_ids: Optional[tuple[int, ...]],
+    as_of: date,
+) -> str:
+    """A cache key for a get_advisees call, which changes whenever
+    the advisory pairs are rebuilt"""
+
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        version = uuid4().hex
+        cache.add(CACHE_VERSION_KEY, version, None)
+        version = cache.get(CACHE_VERSION_KEY, version)
+
+    # Limits can hold hundreds of IDs, which is too long for some cache backends
+    digest = hashlib.sha256(repr((teacher_ids, student_ids)).encode()).hexdigest()
+    return f"blackbaud:advisees:{version}:{as_of.isoformat()}:{digest}"
+
+
+def invalidate_advisees_cache():
+    """Drop every cached advisee lookup, such as after a SIS sync"""
+
+    cache.set(CACHE_VERSION_KEY, uuid4().hex, None)
+
+
+def refresh_advisory_pairs() -> int:
+    """Rebuild the advisory pairs from the enrollments in the advisory
+    sections, returning how many pairs there are
+
+    A pair covers the overlap of a teacher's and a student's enrollment
+    in the same section. The pairs are worked out in a single query, so
+    enrollments that never overlap are never loaded, and only the pairs
+    that changed are written."""
+
+    school_students = Student.objects.filter(schools__in=get_advisory_schools())
+    advisory_sections = get_advisory_sections().filter(students__in=school_students)
+
+    # Every annotation goes through the same teacher enrollment join, so each
+    # row is one student enrollment paired with one teacher enrollment
+    # from the same section, with their overlap worked out by the database
+    teacher_enrollment = "section__teacher_enrollments"
+    pairs = (
+        StudentEnrollment.objects.filter(
+            section__in=advisory_sections,
+            active=True,
+        )
+        .annotate(
+            teacher_active=F(f"{teacher_enrollment}__active"),
+            pair_teacher_id=F(f"{teacher_enrollment}__teacher_id"),
+            pair_begin=Greatest("begin_date", f"{teacher_enrollment}__begin_date"),
+            pair_end=Least("end_date", f"{teacher_enrollment}__end_date"),
+        )
+        .filter(teacher_active=True, pair_begin__lte=F("pair_end"))
+        .values_list("pair_teacher_id", "student_id", "pair_begin", "pair_end")
+        .distinct()
+    )
+
+    desired: set[tuple[int, int, date, date]] = set(pairs)
+
+    current = {
+        (teacher_id, student_id, begin_date, end_date): pk
+        for pk, teacher_id, student_id, begin_date, end_date in (
+            AdvisoryPair.objects.values_list(
+                "pk", "teacher_id", "student_id", "begin_date", "end_date"
+            )
+        )
+    }
+
+    to_delete = [pk for key, pk in current.items() if key not in desired]
+    to_add = desired - current.keys()
+
+    if not to_delete and not to_add:
+        return len(desired)
+
+    with transaction.atomic():
+        AdvisoryPair.objects.filter(pk__in=to_delete).delete()
+
+        AdvisoryPair.objects.bulk_create(
+            [
+                AdvisoryPair(
+                    teacher_id=teacher_id,
+                    student_id=student_id,
+                    begin_date=begin_date,
+                    end_date=end_date,
+                )
+                for teacher_id, student_id, begin_date, end_date in to_add
+            ]
+        )
+
+        # Dropping the cache again once the new pairs are visible keeps other
+        # requests from caching the old pairs while this transaction is open
+        invalidate_advisees_cache()
+        transaction.on_commit(invalidate_advisees_cache)
+
+    return len(desired)
+
+
 def get_advisees_by_advisors(
     limit_teachers: Optional[Iterable[Teacher]] = None,
     limit_students: Optional[Iterable[Student]] = None,
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BlackbaudConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "blackbaud"
+
+    def ready(self):
+        from blackbaud import (  # pylint: disable=unused-import,import-outside-toplevel
+            signals,
+        )
@@ -0,0 +1,77 @@
+"""Previews of the changes a SIS sync would make"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+@dataclass
+class ModelDiff:
+    """The changes a sync would make to a single model, by SIS ID"""
+
+    model: str
+
+    added: List[str] = field(default_factory=list)
+    changed: Dict[str, Dict[str, Tuple[Any, Any]]] = field(default_factory=dict)
+    deactivated: List[str] = field(default_factory=list)
+
+    # Added and removed targets, by attribute and then by SIS ID
+    many_to_many: Dict[str, Dict[str, Tuple[Set[str], Set[str]]]] = field(
+        default_factory=dict
+    )
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.deactivated or self.many_to_many)
+
+    @property
+    def summary(self) -> str:
+        many_to_many = sum(len(by_id) for by_id in self.many_to_many.values())
+
+        return (
+            f"{self.model}: {len(self.added)} added, {len(self.changed)} changed, "
+            f"{len(self.deactivated)} deactivated, {many_to_many} relation changes"
+        )
+
+
+def format_diff(diff: ModelDiff, limit: Optional[int] = None) -> Iterator[str]:
+    """Compact, line based output of a diff, with at
+    most limit lines for each kind of change"""
+
+    yield diff.summary
+
+    yield from _limited((f"  + {sis_id}" for sis_id in sorted(diff.added)), limit)
+
+    yield from _limited(
+        (
+            f"  ~ {sis_id}: "
+            + ", ".join(
+                f"{attr} {old!r} -> {new!r}" for attr, (old, new) in attrs.items()
+            )
+            for sis_id, attrs in sorted(diff.changed.items())
+        ),
+        limit,
+    )
+
+    yield from _limited((f"  - {sis_id}" for sis_id in sorted(diff.deactivated)), limit)
+
+    for attr, by_id in sorted(diff.many_to_many.items()):
+        yield from _limited(
+            (
+                f"  ~ {sis_id}: {attr} +{sorted(added)} -{sorted(removed)}"
+                for sis_id, (added, removed) in sorted(by_id.items())
+            ),
+            limit,
+        )
+
+
+def _limited(lines: Iterator[str], limit: Optional[int]) -> Iterator[str]:
+    remaining = 0
+
+    for i, line in enumerate(lines):
+        if limit is not None and i >= limit:
+            remaining += 1
+            continue
+
+        yield line
+
+    if remaining:
+        yield f"    ... and {remaining} more"
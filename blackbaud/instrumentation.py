@@ -0,0 +1,110 @@
+"""Timings and row counts collected during a SIS sync"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from blackbaud import models
+
+
+@dataclass
+class PhaseMetrics:
+    """Metrics for a single endpoint"""
+
+    name: str
+
+    download_seconds: float = 0
+    pages: int = 0
+    bytes: int = 0
+    transform_seconds: float = 0
+    write_seconds: float = 0
+
+    rows: int = 0
+    added: int = 0
+    changed: int = 0
+    deactivated: int = 0
+
+    def metered(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass rows through, counting the time spent waiting on them
+        as download time"""
+
+        it = iter(rows)
+
+        while True:
+            started = time.monotonic()
+            try:
+                row = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.download_seconds += time.monotonic() - started
+
+            yield row
+
+
+@dataclass
+class SyncMetrics:
+    """Metrics for a full sync run"""
+
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    incremental: bool = False
+    error: str = ""
+    phases: Dict[str, PhaseMetrics] = field(default_factory=dict)
+
+    def phase(self, name: str) -> PhaseMetrics:
+        """Get or create the metrics for a phase"""
+
+        if name not in self.phases:
+            self.phases[name] = PhaseMetrics(name)
+
+        return self.phases[name]
+
+    def start(self, incremental: bool):
+        self.started_at = timezone.now()
+        self.incremental = incremental
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.finished_at = timezone.now()
+        if error:
+            self.error = repr(error)
+
+    def record(self, config: models.SyncConfig) -> models.SyncRun:
+        """Save the metrics as a sync run, pruning old runs"""
+
+        assert self.started_at
+
+        run = models.SyncRun.objects.create(
+            config=config,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            incremental=self.incremental,
+            success=not self.error,
+            error=self.error,
+        )
+
+        models.SyncPhase.objects.bulk_create(
+            models.SyncPhase(
+                run=run,
+                name=phase.name,
+                download_seconds=phase.download_seconds,
+                pages=phase.pages,
+                bytes=phase.bytes,
+                transform_seconds=phase.transform_seconds,
+                write_seconds=phase.write_seconds,
+                rows=phase.rows,
+                added=phase.added,
+                changed=phase.changed,
+                deactivated=phase.deactivated,
+            )
+            for phase in self.phases.values()
+        )
+
+        keep = config.runs.values_list("pk", flat=True)[: settings.SIS_SYNC_RUN_HISTORY]
+        config.runs.exclude(pk__in=list(keep)).delete()
+
+        return run
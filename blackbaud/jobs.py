@@ -9,7 +9,7 @@ from structlog.stdlib import BoundLogger
 from job_runner.registration import register_job
 from job_runner.environment import RunEnv
 
-from blackbaud.sync import auto_sync, SyncNotReady, SyncNotEnabled
+from blackbaud.sync import auto_sync, SyncAlreadyRunning, SyncNotReady, SyncNotEnabled
 
 log: BoundLogger = get_logger(__name__)
 
@@ -23,5 +23,8 @@ def sync_sis(env: RunEnv):
     except SyncNotEnabled:
         log.debug("Sync is not currently enabled")
         return
+    except SyncAlreadyRunning:
+        log.info("Sync is already running")
+        return
     except SyncNotReady as exc:
         log.debug("Sync not ready")
@@ -0,0 +1,64 @@
+"""SIS sync dry run command"""
+
+from dataclasses import asdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blackbaud.diffs import format_diff
+from blackbaud.snapshots import Snapshot, SnapshotError, latest_snapshot
+from blackbaud.sync import dry_run
+
+
+class Command(BaseCommand):
+    help = "Show the changes a full SIS sync would make, without writing anything"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            help="Diff a saved snapshot instead of downloading from the SIS",
+        )
+        parser.add_argument(
+            "--latest",
+            action="store_true",
+            help="Diff the latest saved snapshot instead of downloading from the SIS",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="How many changes of each kind to show per model",
+        )
+        parser.add_argument(
+            "--timings",
+            action="store_true",
+            help="Show how long each phase took",
+        )
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        if opts["latest"]:
+            path = latest_snapshot()
+            if not path:
+                raise CommandError("No saved snapshots were found")
+
+        snapshot = None
+        if path:
+            try:
+                snapshot = Snapshot.load(path)
+            except SnapshotError as exc:
+                raise CommandError(str(exc)) from exc
+
+        diffs, metrics = dry_run(snapshot)
+
+        for diff in diffs:
+            for line in format_diff(diff, opts["limit"]):
+                self.stdout.write(line)
+
+        if opts["timings"]:
+            for phase in metrics.phases.values():
+                values = asdict(phase)
+                name = values.pop("name")
+                self.stdout.write(
+                    f"{name}: " + ", ".join(f"{k}={v}" for k, v in values.items())
+                )
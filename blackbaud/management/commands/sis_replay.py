@@ -0,0 +1,60 @@
+"""SIS snapshot replay command"""
+
+from dataclasses import asdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blackbaud.models import SyncConfig
+from blackbaud.snapshots import Snapshot, SnapshotError, latest_snapshot
+from blackbaud.sync import replay
+
+
+class Command(BaseCommand):
+    help = "Apply a saved SIS snapshot without contacting the SIS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            help="The snapshot directory to replay, defaulting to the latest snapshot",
+        )
+        parser.add_argument(
+            "--rollback",
+            action="store_true",
+            help="Roll back the changes once applied, for profiling the apply stage",
+        )
+        parser.add_argument(
+            "--ignore-digests",
+            action="store_true",
+            help="Transform and check every row, even the ones that haven't changed",
+        )
+
+    def handle(self, *args, **opts):
+        path = opts["path"] or latest_snapshot()
+        if not path:
+            raise CommandError("No path given and no saved snapshots were found")
+
+        try:
+            snapshot = Snapshot.load(path)
+        except SnapshotError as exc:
+            raise CommandError(str(exc)) from exc
+
+        # Make sure the singleton exists on a fresh database
+        SyncConfig.get_solo()
+
+        metrics = replay(
+            snapshot,
+            commit=not opts["rollback"],
+            ignore_digests=opts["ignore_digests"],
+        )
+
+        self.stdout.write(f"Replayed {path}")
+        for phase in metrics.phases.values():
+            values = asdict(phase)
+            name = values.pop("name")
+            self.stdout.write(
+                f"{name}: " + ", ".join(f"{k}={v}" for k, v in values.items())
+            )
+
+        if opts["rollback"]:
+            self.stdout.write("Changes rolled back")
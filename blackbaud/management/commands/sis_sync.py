@@ -7,5 +7,21 @@ from blackbaud.sync import auto_sync
 class Command(BaseCommand):
     help = "Run SIS sync job"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Run a full sync, even if an incremental sync would be allowed",
+        )
+        parser.add_argument(
+            "--ignore-digests",
+            action="store_true",
+            help="Transform and check every row, even the ones that haven't changed",
+        )
+
     def handle(self, *args, **opts):
-        auto_sync(True)
+        auto_sync(
+            True,
+            full=True if opts["full"] else None,
+            ignore_digests=opts["ignore_digests"],
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blackbaud", "0004_syncconfig_teacher_group"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="syncconfig",
+            name="high_water_marks",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="The latest dateLastModified seen on each SIS endpoint",
+            ),
+        ),
+        migrations.AddField(
+            model_name="syncconfig",
+            name="last_full_sync",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
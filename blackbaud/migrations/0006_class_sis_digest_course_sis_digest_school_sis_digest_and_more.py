@@ -0,0 +1,85 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blackbaud", "0005_syncconfig_high_water_marks_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="class",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="school",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="studentenrollment",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="syncconfig",
+            name="endpoint_digests",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Digest of each model's data as of the last full sync",
+            ),
+        ),
+        migrations.AddField(
+            model_name="teacher",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="teacherenrollment",
+            name="sis_digest",
+            field=models.CharField(
+                blank=True,
+                help_text="Digest of the SIS record this was last synced from",
+                max_length=64,
+            ),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:20
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_advisory_pairs(apps, schema_editor):
+    """Build the initial advisory pairs, so advisees don't go missing until the next sync"""
+
+    del schema_editor
+
+    Class = apps.get_model("blackbaud", "Class")
+    Student = apps.get_model("blackbaud", "Student")
+    StudentEnrollment = apps.get_model("blackbaud", "StudentEnrollment")
+    TeacherEnrollment = apps.get_model("blackbaud", "TeacherEnrollment")
+    AdvisoryPair = apps.get_model("blackbaud", "AdvisoryPair")
+
+    school_students = Student.objects.filter(
+        schools__advisory_schools__isnull=False,
+        schools__active=True,
+    )
+    sections = Class.objects.filter(
+        course__advisory_course__isnull=False,
+        course__active=True,
+        active=True,
+        students__in=school_students,
+    )
+
+    teachers_by_section = defaultdict(list)
+    for (
+        section_id,
+        teacher_id,
+        begin_date,
+        end_date,
+    ) in TeacherEnrollment.objects.filter(
+        section__in=sections, active=True
+    ).values_list(
+        "section_id", "teacher_id", "begin_date", "end_date"
+    ):
+        teachers_by_section[section_id].append((teacher_id, begin_date, end_date))
+
+    pairs = set()
+    for (
+        section_id,
+        student_id,
+        begin_date,
+        end_date,
+    ) in StudentEnrollment.objects.filter(
+        section__in=sections, active=True
+    ).values_list(
+        "section_id", "student_id", "begin_date", "end_date"
+    ):
+        for teacher_id, teacher_begin, teacher_end in teachers_by_section[section_id]:
+            begin = max(begin_date, teacher_begin)
+            end = min(end_date, teacher_end)
+            if begin <= end:
+                pairs.add((teacher_id, student_id, begin, end))
+
+    AdvisoryPair.objects.bulk_create(
+        AdvisoryPair(teacher_id=t, student_id=s, begin_date=b, end_date=e)
+        for t, s, b, e in pairs
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blackbaud", "0007_syncrun_syncphase"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AdvisoryPair",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("begin_date", models.DateField()),
+                ("end_date", models.DateField()),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="advisory_pairs",
+                        to="blackbaud.student",
+                    ),
+                ),
+                (
+                    "teacher",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="advisory_pairs",
+                        to="blackbaud.teacher",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["begin_date", "end_date"],
+                        name="blackbaud_a_begin_d_67b790_idx",
+                    ),
+                    models.Index(
+                        fields=["teacher", "begin_date", "end_date"],
+                        name="blackbaud_a_teacher_3a2435_idx",
+                    ),
+                    models.Index(
+                        fields=["student", "begin_date", "end_date"],
+                        name="blackbaud_a_student_c01241_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_advisory_pairs, migrations.RunPython.noop),
+    ]
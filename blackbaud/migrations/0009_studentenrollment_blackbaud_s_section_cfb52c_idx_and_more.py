@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blackbaud", "0008_advisorypair"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="studentenrollment",
+            index=models.Index(
+                fields=["section", "begin_date", "end_date"],
+                name="blackbaud_s_section_cfb52c_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="teacherenrollment",
+            index=models.Index(
+                fields=["section", "begin_date", "end_date"],
+                name="blackbaud_t_section_3bb1d2_idx",
+            ),
+        ),
+    ]
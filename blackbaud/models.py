@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from typing import Optional
 from django.db import models
 from django.utils.translation import gettext as _
 from django.utils import timezone
@@ -24,6 +25,17 @@ class SyncConfig(SingletonModel):
         blank=True,
         null=True,
     )
+    last_full_sync = models.DateTimeField(null=True, blank=True)
+    high_water_marks = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="The latest dateLastModified seen on each SIS endpoint",
+    )
+    endpoint_digests = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Digest of each model's data as of the last full sync",
+    )
 
     @property
     def next_sync(self) -> datetime:
@@ -36,14 +48,84 @@ class SyncConfig(SingletonModel):
     def ready_for_sync(self) -> bool:
         return self.next_sync <= timezone.now()
 
+    @property
+    def full_sync_due(self) -> bool:
+        """If the next sync should be a full sync, which is the only
+        kind of sync that can notice deleted records"""
+
+        if not self.last_full_sync:
+            return True
+
+        next_full_sync = self.last_full_sync + timedelta(
+            seconds=settings.SIS_FULL_SYNC_INTERVAL
+        )
+        return next_full_sync <= timezone.now()
+
     def __str__(self):
         return _("Blackbaud sync config")
 
 
+class SyncRun(models.Model):
+    """A record of a single SIS sync attempt"""
+
+    config = models.ForeignKey(
+        SyncConfig,
+        on_delete=models.CASCADE,
+        related_name="runs",
+    )
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    incremental = models.BooleanField(default=False)
+    success = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    @property
+    def duration(self) -> Optional[timedelta]:
+        if not self.finished_at:
+            return None
+
+        return self.finished_at - self.started_at
+
+    def __str__(self):
+        return f"Sync at {self.started_at}"
+
+
+class SyncPhase(models.Model):
+    """Timings and row counts for a single endpoint during a sync"""
+
+    run = models.ForeignKey(SyncRun, on_delete=models.CASCADE, related_name="phases")
+    name = models.CharField(max_length=256)
+
+    download_seconds = models.FloatField(default=0)
+    pages = models.PositiveIntegerField(default=0)
+    bytes = models.PositiveBigIntegerField(default=0)
+    transform_seconds = models.FloatField(default=0)
+    write_seconds = models.FloatField(default=0)
+
+    rows = models.PositiveIntegerField(default=0)
+    added = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+    deactivated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["run", "pk"]
+
+    def __str__(self):
+        return self.name
+
+
 class SISModel(models.Model):
     """Base model for all SIS models"""
 
     sis_id = models.CharField(max_length=256, unique=True)
+    sis_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Digest of the SIS record this was last synced from",
+    )
     active = models.BooleanField()
 
     class Meta:
@@ -161,6 +243,9 @@ class TeacherEnrollment(SISModel):
     begin_date = models.DateField()
     end_date = models.DateField()
 
+    class Meta:
+        indexes = [models.Index(fields=["section", "begin_date", "end_date"])]
+
     def __str__(self):
         return f"{self.section}: {self.teacher}"
 
@@ -181,6 +266,9 @@ class StudentEnrollment(SISModel):
     begin_date = models.DateField()
     end_date = models.DateField()
 
+    class Meta:
+        indexes = [models.Index(fields=["section", "begin_date", "end_date"])]
+
     def __str__(self):
         return f"{self.section}: {self.student}"
 
@@ -222,3 +310,35 @@ class AdvisorySchool(models.Model):
 
     class Meta:
         ordering = ["school"]
+
+
+class AdvisoryPair(models.Model):
+    """An advisor/advisee relationship over a date range
+
+    These are derived from the enrollments in advisory sections, and are
+    rebuilt at the end of every sync and whenever the advisory courses or
+    schools change. They should never be edited directly."""
+
+    teacher = models.ForeignKey(
+        Teacher,
+        on_delete=models.CASCADE,
+        related_name="advisory_pairs",
+    )
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name="advisory_pairs",
+    )
+
+    begin_date = models.DateField()
+    end_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["begin_date", "end_date"]),
+            models.Index(fields=["teacher", "begin_date", "end_date"]),
+            models.Index(fields=["student", "begin_date", "end_date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.teacher} / {self.student}: {self.begin_date} - {self.end_date}"
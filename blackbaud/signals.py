@@ -0,0 +1,17 @@
+"""Signal handlers for Blackbaud models"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from blackbaud.advising import refresh_advisory_pairs
+from blackbaud.models import AdvisoryCourse, AdvisorySchool
+
+
+@receiver(post_save, sender=AdvisoryCourse)
+@receiver(post_delete, sender=AdvisoryCourse)
+@receiver(post_save, sender=AdvisorySchool)
+@receiver(post_delete, sender=AdvisorySchool)
+def advisory_config_changed(**kwargs):
+    """Rebuild the advisory pairs in the same transaction as the change"""
+
+    refresh_advisory_pairs()
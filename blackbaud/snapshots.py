@@ -0,0 +1,207 @@
+"""Snapshots of SIS data, fetched ahead of being applied
+
+A snapshot can be saved to disk as a directory holding a manifest and one
+gzipped JSON Lines file per endpoint, so that it can be replayed later
+without talking to the SIS"""
+
+import gzip
+import json
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from django.conf import settings
+from django.utils import timezone
+
+from structlog import get_logger
+from structlog.stdlib import BoundLogger
+
+log: BoundLogger = get_logger(__name__)
+
+# Bump this whenever the on-disk layout changes
+SNAPSHOT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+
+class SnapshotError(Exception):
+    """A snapshot could not be read"""
+
+
+class Snapshot:
+    """SIS records by endpoint, spooled to gzipped JSON Lines files
+
+    A new snapshot writes its records to a temporary directory as they
+    arrive, so that no endpoint is ever held in memory in full. The
+    temporary directory is removed when the snapshot is closed."""
+
+    def __init__(self):
+        self._files: Dict[str, Path] = {}
+        self._counts: Dict[str, int] = {}
+        self._spool: Optional[tempfile.TemporaryDirectory] = None
+        self._lock = threading.Lock()
+        self.partial: Set[str] = set()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._spool:
+            self._spool.cleanup()
+            self._spool = None
+
+    def add(self, endpoint: str, records: Iterable[Dict], partial: bool = False):
+        """Spool the records of an endpoint. Partial endpoints only
+        have the records that were modified since the last sync. Endpoints
+        can be added from several threads at once."""
+
+        with self._lock:
+            if not self._spool:
+                self._spool = tempfile.TemporaryDirectory(prefix="sis-snapshot-")
+
+            path = Path(self._spool.name) / _file_name(len(self._files), endpoint)
+            self._files[endpoint] = path
+
+        count = 0
+
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")))
+                f.write("\n")
+                count += 1
+
+        with self._lock:
+            self._counts[endpoint] = count
+            if partial:
+                self.partial.add(endpoint)
+
+    def records(self, endpoint: str) -> Iterator[Dict]:
+        with gzip.open(self._files[endpoint], "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    @property
+    def endpoints(self) -> List[str]:
+        return list(self._files)
+
+    def save(self, path: Path):
+        """Copy the snapshot out to a new directory
+
+        The snapshot is written next to its final location and renamed
+        into place, so a partially written snapshot is never loaded"""
+
+        path = Path(path)
+        working = path.with_name(f".{path.name}.tmp")
+        if working.exists():
+            shutil.rmtree(working)
+
+        working.mkdir(parents=True)
+
+        files = {}
+        for endpoint, source in self._files.items():
+            shutil.copyfile(source, working / source.name)
+            files[endpoint] = {
+                "file": source.name,
+                "records": self._counts[endpoint],
+                "partial": endpoint in self.partial,
+            }
+
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": timezone.now().isoformat(),
+            "endpoints": files,
+        }
+
+        with open(working / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        working.rename(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "Snapshot":
+        """Open a saved snapshot. Records are read from disk as they are used"""
+
+        path = Path(path)
+
+        try:
+            with open(path / MANIFEST_NAME, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise SnapshotError(f"Could not read snapshot manifest in {path}") from exc
+
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise SnapshotError(
+                f"Snapshot {path} has version {manifest.get('version')}, "
+                f"expected {SNAPSHOT_VERSION}"
+            )
+
+        snapshot = cls()
+        for endpoint, info in manifest["endpoints"].items():
+            snapshot._files[endpoint] = path / info["file"]
+            snapshot._counts[endpoint] = info["records"]
+            if info["partial"]:
+                snapshot.partial.add(endpoint)
+
+        return snapshot
+
+
+def _file_name(index: int, endpoint: str) -> str:
+    return f"{index:02d}-{endpoint.rstrip('/').rsplit('/', 1)[-1]}.jsonl.gz"
+
+
+def snapshot_dir() -> Optional[Path]:
+    if not settings.SIS_SNAPSHOT_DIR:
+        return None
+
+    return Path(settings.SIS_SNAPSHOT_DIR)
+
+
+def save_snapshot(snapshot: Snapshot) -> Optional[Path]:
+    """Save a freshly fetched snapshot, if snapshots are enabled,
+    and prune the older ones"""
+
+    root = snapshot_dir()
+    if not root:
+        return None
+
+    path = root / timezone.now().strftime("%Y%m%dT%H%M%S%fZ")
+
+    # A snapshot is only a convenience, so failing to write
+    # one shouldn't stop the sync from being applied
+    try:
+        snapshot.save(path)
+        for old in saved_snapshots()[: -max(settings.SIS_SNAPSHOT_HISTORY, 1)]:
+            shutil.rmtree(old)
+    except OSError:
+        log.exception("Unable to save SIS snapshot", path=str(path))
+        return None
+
+    log.info("Saved SIS snapshot", path=str(path))
+    return path
+
+
+def saved_snapshots() -> List[Path]:
+    """All complete snapshots on disk, oldest first"""
+
+    root = snapshot_dir()
+    if not root or not root.is_dir():
+        return []
+
+    return sorted(
+        p
+        for p in root.iterdir()
+        if p.is_dir() and not p.name.startswith(".") and (p / MANIFEST_NAME).exists()
+    )
+
+
+def latest_snapshot() -> Optional[Path]:
+    snapshots = saved_snapshots()
+    if not snapshots:
+        return None
+
+    return snapshots[-1]
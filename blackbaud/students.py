@@ -1,14 +1,12 @@
 """Calculations about students"""
 
-from collections import defaultdict
+from bisect import bisect_left, bisect_right
 from datetime import date
-from typing import DefaultDict, Dict, Iterable, Sequence, Set, Tuple
+from typing import Dict, Iterable, Sequence, Set, Tuple
 from blackbaud.models import (
     Student,
     Teacher,
     StudentEnrollment,
-    TeacherEnrollment,
-    Class,
 )
 
 
@@ -18,58 +16,68 @@ def teachers_for_students(
     """Get the teachers that a relevant to a collection
     of students for a set of given dates"""
 
-    student_enrollments: Iterable[StudentEnrollment] = StudentEnrollment.objects.filter(
-        student__in=students
-    )
+    students = list(students)
     students_by_id: Dict[int, Student] = {obj.pk: obj for obj in students}
 
-    relevant_class_ids: Set[int] = {e.section_id for e in student_enrollments}
-
-    relevant_classes: Iterable[Class] = Class.objects.filter(pk__in=relevant_class_ids)
+    # Pre-create the return dictionary so we are guaranteed
+    # to have every student/date pair for return
+    out: Dict[Tuple[Student, date], Set[Teacher]] = {
+        (s, d): set() for s in students for d in dates
+    }
 
-    teacher_enrollments: Iterable[TeacherEnrollment] = TeacherEnrollment.objects.filter(
-        section_id__in=relevant_class_ids
-    )
-    teachers: Iterable[Teacher] = Teacher.objects.filter(
-        enrollments__in=teacher_enrollments
+    if not students or not dates:
+        return out
+
+    sorted_dates: Sequence[date] = sorted(dates)
+
+    # Each row is a student enrollment joined to a teacher enrollment in
+    # the same section, limited to the pairs that could cover a date
+    teacher_enrollment = "section__teacher_enrollments"
+    rows = StudentEnrollment.objects.filter(
+        student__in=students,
+        begin_date__lte=sorted_dates[-1],
+        end_date__gte=sorted_dates[0],
+        **{
+            f"{teacher_enrollment}__begin_date__lte": sorted_dates[-1],
+            f"{teacher_enrollment}__end_date__gte": sorted_dates[0],
+        },
+    ).values_list(
+        "student_id",
+        f"{teacher_enrollment}__teacher_id",
+        "begin_date",
+        "end_date",
+        f"{teacher_enrollment}__begin_date",
+        f"{teacher_enrollment}__end_date",
     )
 
-    teachers_by_id = {obj.pk: obj for obj in teachers}
+    matches: Set[Tuple[int, int, date]] = set()
+    for student_id, teacher_id, s_begin, s_end, t_begin, t_end in rows:
+        # A teacher is relevant on the dates where both enrollments
+        # overlap, which are a contiguous run of the sorted dates
+        begin_date = max(s_begin, t_begin)
+        end_date = min(s_end, t_end)
+        if begin_date > end_date:
+            continue
 
-    teacher_enrollments_by_section_id: DefaultDict[int, Set[TeacherEnrollment]] = (
-        defaultdict(set)
-    )
-    student_enrollments_by_section_id: DefaultDict[int, Set[StudentEnrollment]] = (
-        defaultdict(set)
-    )
+        for d in _dates_between(sorted_dates, begin_date, end_date):
+            matches.add((student_id, teacher_id, d))
 
-    for e_teacher in teacher_enrollments:
-        teacher_enrollments_by_section_id[e_teacher.section_id].add(e_teacher)
+    teachers_by_id: Dict[int, Teacher] = Teacher.objects.in_bulk(
+        {teacher_id for _, teacher_id, _ in matches}
+    )
 
-    for e_student in student_enrollments:
-        student_enrollments_by_section_id[e_student.section_id].add(e_student)
+    for student_id, teacher_id, d in matches:
+        out[(students_by_id[student_id], d)].add(teachers_by_id[teacher_id])
 
-    # Pre-create the return dictionary so we are guaranteed
-    # to have every student/date pair for return
-    out: Dict[Tuple[Student, date], Set[Teacher]] = {
-        (s, d): set() for s in students for d in dates
-    }
+    return out
 
-    for section in relevant_classes:
-        section_id: int = section.pk
-        s_e_objs = student_enrollments_by_section_id[section_id]
-        t_e_objs = teacher_enrollments_by_section_id[section_id]
 
-        for d in dates:
-            for s_e in s_e_objs:
-                student_id = s_e.student_id
-                student = students_by_id[student_id]
+def _dates_between(
+    sorted_dates: Sequence[date], begin_date: date, end_date: date
+) -> Sequence[date]:
+    """The dates within an inclusive range, from a sorted sequence of dates"""
 
-                if s_e.begin_date <= d and d <= s_e.end_date:
-                    for t_e in t_e_objs:
-                        teacher_id = t_e.teacher_id
-                        teacher = teachers_by_id[teacher_id]
-                        if t_e.begin_date <= d and d <= t_e.end_date:
-                            out[(student, d)].add(teacher)
+    start = bisect_left(sorted_dates, begin_date)
+    end = bisect_right(sorted_dates, end_date)
 
-    return out
+    return sorted_dates[start:end]
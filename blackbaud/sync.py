@@ -1,8 +1,30 @@
 """Synchronization methods for Blackbaud"""
 
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict
 from datetime import datetime
+import hashlib
+import json
+import threading
 import time
-from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
 import urllib.parse
 from base64 import b64encode
 
@@ -10,23 +32,57 @@ from structlog import get_logger
 from structlog.stdlib import BoundLogger
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 log: BoundLogger = get_logger(__name__)
 
 
 from django.utils.translation import gettext as _
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils import timezone
 import django.contrib.auth.models
 from django.contrib.auth import get_user_model
 
 from blackbaud import models
+from blackbaud.advising import invalidate_advisees_cache, refresh_advisory_pairs
+from blackbaud.diffs import ModelDiff
+from blackbaud.instrumentation import PhaseMetrics, SyncMetrics
+from blackbaud.snapshots import Snapshot, save_snapshot
 
 Model = TypeVar("Model", bound=models.SISModel)
 
+# Primary keys by SIS ID, used to resolve foreign keys in the transforms
+PKMap = Dict[str, int]
+
 UserModel = get_user_model()
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+SCHOOLS_ENDPOINT = "/afe-rostr/ims/oneroster/v1p1/schools"
+COURSES_ENDPOINT = "/afe-rostr/ims/oneroster/v1p1/courses"
+CLASSES_ENDPOINT = "/afe-rostr/ims/oneroster/v1p1/classes"
+TEACHERS_ENDPOINT = "/afe-rostr/ims/oneroster/v1p1/teachers"
+STUDENTS_ENDPOINT = "/afe-rostr/ims/oneroster/v1p1/students"
+ENROLLMENTS_ENDPOINT = "/afe-rostr/ims/oneroster/v1p1/enrollments"
+
+ENDPOINTS = (
+    SCHOOLS_ENDPOINT,
+    COURSES_ENDPOINT,
+    CLASSES_ENDPOINT,
+    TEACHERS_ENDPOINT,
+    STUDENTS_ENDPOINT,
+    ENROLLMENTS_ENDPOINT,
+)
+
+# Arbitrary, but shared by every process that runs the sync
+SYNC_LOCK_ID = 7_274_001
+
+# Part of every row and data set digest. Bump this whenever a transform or the
+# fields it maps change, so that the next sync reapplies every row
+TRANSFORM_VERSION = 1
+
 
 class SyncNotReady(Exception):
     """The sync isn't ready to be run yet"""
@@ -39,6 +95,10 @@ class SyncNotEnabled(Exception):
     """The sync has not been enabled"""
 
 
+class SyncAlreadyRunning(Exception):
+    """Another process is already running the sync"""
+
+
 class SyncNotConfigured(Exception):
     def __init__(self, param_name: str):
         self.param_name = param_name
@@ -50,22 +110,37 @@ class API:
     def __init__(self):
         self._access_token_expiration: float = 0
         self._cached_access_token: str = ""
+        self._token_lock = threading.Lock()
+        self._session = _build_session()
+
+    def __enter__(self) -> "API":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the pooled connections"""
+
+        self._session.close()
 
     @property
     def _access_token(self) -> str:
         """Get the cached access token or create a new one"""
 
-        if self._access_token_expiration < time.monotonic():
-            resp = self._get_access_token_request()
-            resp.raise_for_status()
+        # Endpoints are fetched from several threads, which should share one token
+        with self._token_lock:
+            if self._access_token_expiration < time.monotonic():
+                resp = self._get_access_token_request()
+                resp.raise_for_status()
 
-            data = resp.json()
-            self._cached_access_token = data["access_token"]
-            expiration_delay = data["expires_in"] * 0.75
-            # For sanity, only hold the bearer token available for 75% of its actual time to avoid the edge case
-            self._access_token_expiration = time.monotonic() + expiration_delay
+                data = resp.json()
+                self._cached_access_token = data["access_token"]
+                expiration_delay = data["expires_in"] * 0.75
+                # For sanity, only hold the bearer token available for 75% of its actual time to avoid the edge case
+                self._access_token_expiration = time.monotonic() + expiration_delay
 
-        return self._cached_access_token
+            return self._cached_access_token
 
     @property
     def _token_url(self) -> str:
@@ -106,47 +181,273 @@ class API:
 
         headers = {"Authorization": f"Basic {encoded_key}"}
 
-        resp = requests.post(self._token_url, data=data, headers=headers)
+        resp = self._session.post(self._token_url, data=data, headers=headers)
         return resp
 
-    def get(self, endpoint: str):
+    def get(self, endpoint: str) -> Dict[str, Dict]:
+        """Get all the records of an endpoint, keyed by sourcedId"""
+
+        return {record["sourcedId"]: record for record in self.iter_records(endpoint)}
+
+    def iter_records(
+        self,
+        endpoint: str,
+        filter: Optional[str] = None,
+        metrics: Optional[PhaseMetrics] = None,
+    ) -> Iterator[Dict]:
+        """Stream all the records of an endpoint, optionally limited
+        by a OneRoster filter expression
+
+        The first page tells us the total record count, after which the
+        remaining pages are requested concurrently. Records are yielded in page
+        order as soon as their page has arrived."""
+
+        if metrics is None:
+            metrics = PhaseMetrics(endpoint)
+
         headers = {
             "Authorization": f"Bearer {self._access_token}",
         }
 
-        params = {"limit": 100, "offset": 0}
+        page_size: int = settings.BLACKBAUD_PAGE_SIZE
+        parallelism: int = settings.BLACKBAUD_FETCH_PARALLELISM
+
+        def get_page(offset: int) -> _Page:
+            return self._get_page(endpoint, headers, offset, page_size, filter)
+
+        page = get_page(0)
+        metrics.pages += 1
+        metrics.bytes += page.size
+        yield from page.records
+
+        offsets = range(page_size, page.total_count, page_size)
+        if not offsets:
+            return
+
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            for page in executor.map(get_page, offsets):
+                metrics.pages += 1
+                metrics.bytes += page.size
+                yield from page.records
+
+    def _get_page(
+        self,
+        endpoint: str,
+        headers: Dict[str, str],
+        offset: int,
+        limit: int,
+        filter: Optional[str] = None,
+    ) -> "_Page":
+        """Get a single page of records, along with the total record count"""
+
+        params: Dict[str, str | int] = {"limit": limit, "offset": offset}
+        if filter:
+            params["filter"] = filter
+
+        url = f"{self._api_base_url}{endpoint}?{urllib.parse.urlencode(params)}"
+        log.debug("Getting URL", url=url)
+        resp = self._session.get(url, headers=headers)
+        resp.raise_for_status()
+        json_data = resp.json()
+        expected_count = int(resp.headers["x-total-count"])
+        keys = json_data.keys()
+
+        if len(keys) != 1:
+            raise ValueError("Got multiple keys")
+
+        key = set(keys).pop()
+        return _Page(json_data[key], expected_count, len(resp.content))
+
+
+class _Page(NamedTuple):
+    records: List[Dict]
+    total_count: int
+    size: int
+
+
+def _build_session() -> requests.Session:
+    """Build a pooled session that backs off and retries when rate limited
+
+    Retry-After is honored on 429 and 503 responses, and every other
+    retryable status uses exponential backoff"""
+
+    retry = Retry(
+        total=settings.BLACKBAUD_MAX_RETRIES,
+        backoff_factor=settings.BLACKBAUD_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods={"GET", "POST"},
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
 
-        records: List[Dict] = []
-        expected_count: Optional[int] = None
+    # The pool has to be at least as large as the number of concurrent
+    # page requests, or connections will be discarded
+    pool_size = max(
+        settings.BLACKBAUD_POOL_SIZE,
+        settings.BLACKBAUD_FETCH_PARALLELISM * settings.BLACKBAUD_ENDPOINT_PARALLELISM,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
 
-        while expected_count is None or len(records) < expected_count:
-            url = f"{self._api_base_url}{endpoint}?{urllib.parse.urlencode(params)}"
-            log.debug("Getting URL", url=url)
-            resp = requests.get(url, headers=headers)
-            resp.raise_for_status()
-            json_data = resp.json()
-            expected_count = int(resp.headers["x-total-count"])
-            keys = json_data.keys()
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
-            if len(keys) != 1:
-                raise ValueError("Got multiple keys")
+    return session
 
-            key = set(keys).pop()
-            data = json_data[key]
-            records.extend(data)
-            params["offset"] += params["limit"]
 
-        out = {record["sourcedId"]: record for record in records}
+def auto_sync(force=False, full: Optional[bool] = None, ignore_digests=False):
+    """Run the SIS sync
 
-        return out
+    Unless a full sync is explicitly requested or refused, a full sync
+    is run when one is due and an incremental sync is run otherwise.
+    Ignoring the digests runs a full sync that transforms and checks every
+    row, even the ones that are unchanged since the last sync.
 
+    The sync config is only locked long enough to claim the sync. All of the
+    SIS data is then downloaded outside of any transaction, and applied in a
+    single short transaction at the end. An advisory lock keeps two syncs
+    from running at the same time."""
 
-def auto_sync(force=False):
     # This just ensures the singleton exists
-    models.SyncConfig.get_solo()
+    config = models.SyncConfig.get_solo()
+    metrics = SyncMetrics()
+
+    if ignore_digests:
+        full = True
+
+    try:
+        with _sync_lock():
+            config, full = _claim_sync(force, full)
+            metrics.start(incremental=not full)
+
+            high_water_marks: Dict[str, str] = {}
+            if not full:
+                high_water_marks = dict(config.high_water_marks)
+
+            with _fetch(high_water_marks, metrics) as snapshot:
+                save_snapshot(snapshot)
+
+                with transaction.atomic():
+                    _apply(config, snapshot, metrics, ignore_digests=ignore_digests)
+
+                    config.high_water_marks = high_water_marks
+                    update_fields = ["high_water_marks", "endpoint_digests"]
+                    if full:
+                        config.last_full_sync = config.last_sync_attempt
+                        update_fields.append("last_full_sync")
+
+                    # Only the sync's own fields are saved, so admin
+                    # edits made during the download aren't lost
+                    config.save(update_fields=update_fields)
+    except Exception as exc:
+        metrics.finish(exc)
+        raise
+    else:
+        metrics.finish()
+    finally:
+        # The run is recorded outside of the sync transaction,
+        # so that failed runs are kept too
+        if metrics.started_at:
+            metrics.record(config)
+
+
+def replay(
+    snapshot: Snapshot, commit: bool = True, ignore_digests: bool = False
+) -> SyncMetrics:
+    """Apply a saved snapshot without contacting the SIS
+
+    High water marks are left alone, so the next incremental sync still
+    fetches everything modified since the last real sync"""
+
+    metrics = SyncMetrics()
+
+    with _sync_lock():
+        metrics.start(incremental=bool(snapshot.partial))
+
+        with transaction.atomic():
+            config = models.SyncConfig.objects.select_for_update().get()
+            _apply(config, snapshot, metrics, ignore_digests=ignore_digests)
+
+            if commit:
+                config.save(update_fields=["endpoint_digests"])
+            else:
+                transaction.set_rollback(True)
+
+        metrics.finish()
+
+    return metrics
+
+
+def dry_run(
+    snapshot: Optional[Snapshot] = None,
+) -> Tuple[List[ModelDiff], SyncMetrics]:
+    """Work out the changes a sync would make without writing anything
+
+    A full snapshot is downloaded when none is given. The metrics keep the
+    time spent working out the diff apart from the download time, which is
+    useful for tuning against real data."""
+
+    metrics = SyncMetrics()
+    metrics.start(incremental=False)
+
+    if snapshot is None:
+        with _fetch({}, metrics) as fetched:
+            return _dry_run_apply(fetched, metrics), metrics
+
+    return _dry_run_apply(snapshot, metrics), metrics
+
+
+def _dry_run_apply(snapshot: Snapshot, metrics: SyncMetrics) -> List[ModelDiff]:
+    diffs: List[ModelDiff] = []
+
+    # Nothing should be written, but roll back anyway to be safe
+    with transaction.atomic():
+        _apply(models.SyncConfig.get_solo(), snapshot, metrics, diffs)
+        transaction.set_rollback(True)
+
+    metrics.finish()
+    return diffs
+
+
+@contextmanager
+def _sync_lock():
+    """Hold an advisory lock for the length of a sync
+
+    Only Postgres supports advisory locks, so syncs aren't
+    guarded against each other on any other database"""
+
+    if connection.vendor != "postgresql":
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [SYNC_LOCK_ID])
+        (acquired,) = cursor.fetchone()
+
+    if not acquired:
+        raise SyncAlreadyRunning()
+
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [SYNC_LOCK_ID])
+
+
+def _claim_sync(
+    force: bool,
+    full: Optional[bool],
+) -> Tuple[models.SyncConfig, bool]:
+    """Check that a sync can be run and mark the attempt, returning the
+    config and if the sync should be a full sync"""
 
     with transaction.atomic():
-        config: models.SyncConfig = models.SyncConfig.objects.select_for_update().get()
+        config = models.SyncConfig.objects.select_for_update().get()
 
         if not force:
             if not config.sync_enabled:
@@ -157,246 +458,774 @@ def auto_sync(force=False):
 
         config.last_sync_attempt = timezone.now()
         config.sync_asap = False
-        config.save()
+        config.save(update_fields=["last_sync_attempt", "sync_asap"])
 
-        with transaction.atomic():
-            _sync(config)
+    if full is None:
+        full = config.full_sync_due
+
+    return config, full
+
+
+def _fetch(high_water_marks: Dict[str, str], metrics: SyncMetrics) -> Snapshot:
+    """Download every endpoint into a snapshot without touching the database
+
+    Nothing is written until the whole snapshot has been downloaded, so the
+    endpoints don't depend on each other and are downloaded concurrently.
+    Foreign key order only matters when the snapshot is applied.
+
+    Endpoints with a high water mark only fetch the records modified since
+    then, and the high water marks are moved forward as records arrive"""
+
+    log.info("Fetching Blackbaud data", incremental=bool(high_water_marks))
+
+    snapshot = Snapshot()
+    phases = {
+        endpoint: metrics.phase(_endpoint_name(endpoint)) for endpoint in ENDPOINTS
+    }
 
+    def fetch_endpoint(api: API, endpoint: str):
+        phase = phases[endpoint]
+        since = high_water_marks.get(endpoint)
+        rows = api.iter_records(endpoint, _modified_since_filter(since), phase)
+        rows = _track_high_water_mark(phase.metered(rows), endpoint, high_water_marks)
+        snapshot.add(endpoint, rows, partial=since is not None)
+
+    try:
+        with (
+            API() as api,
+            ThreadPoolExecutor(
+                max_workers=settings.BLACKBAUD_ENDPOINT_PARALLELISM
+            ) as executor,
+        ):
+            futures = [executor.submit(fetch_endpoint, api, e) for e in ENDPOINTS]
+
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+    except BaseException:
+        snapshot.close()
+        raise
+
+    return snapshot
+
+
+def _apply(
+    config: models.SyncConfig,
+    snapshot: Snapshot,
+    metrics: Optional[SyncMetrics] = None,
+    diffs: Optional[List[ModelDiff]] = None,
+    ignore_digests: bool = False,
+):
+    """Apply a snapshot to the database, in foreign key order. The new
+    digests are recorded on the config without saving it.
+
+    When a diffs list is given nothing is written, and the changes
+    that would have been made are added to it instead. Ignoring the
+    digests checks every row, not just the ones that changed."""
+
+    log.info("Beginning Blackbaud sync", partial=sorted(snapshot.partial))
 
-def _sync(config: models.SyncConfig):
-    log.info("Beginning Blackbaud sync")
+    if metrics is None:
+        metrics = SyncMetrics()
 
-    api = API()
+    digests: Dict[str, str] = dict(config.endpoint_digests)
 
     schools = _auto_sync(
-        api,
         models.School,
-        "/afe-rostr/ims/oneroster/v1p1/schools",
+        snapshot,
+        SCHOOLS_ENDPOINT,
         _transform_schools,
+        digests,
+        metrics,
+        diffs,
+        ignore_digests,
     )
 
     courses = _auto_sync(
-        api,
         models.Course,
-        "/afe-rostr/ims/oneroster/v1p1/courses",
+        snapshot,
+        COURSES_ENDPOINT,
         _transform_course,
+        digests,
+        metrics,
+        diffs,
+        ignore_digests,
     )
 
     classes = _auto_sync(
-        api,
         models.Class,
-        "/afe-rostr/ims/oneroster/v1p1/classes",
+        snapshot,
+        CLASSES_ENDPOINT,
         _get_transform_classes(schools, courses),
+        digests,
+        metrics,
+        diffs,
+        ignore_digests,
     )
 
     teachers = _auto_sync(
-        api,
         models.Teacher,
-        "/afe-rostr/ims/oneroster/v1p1/teachers",
+        snapshot,
+        TEACHERS_ENDPOINT,
         _get_transform_teachers(schools),
+        digests,
+        metrics,
+        diffs,
+        ignore_digests,
     )
 
-    if config.teacher_group:
-        _reconcile_teacher_group(teachers.values(), config.teacher_group)
+    if config.teacher_group and diffs is None:
+        phase = metrics.phase("teacher group")
+        started = time.monotonic()
+        _reconcile_teacher_group(
+            models.Teacher.objects.values_list("email", flat=True),
+            config.teacher_group,
+        )
+        phase.write_seconds += time.monotonic() - started
 
     students = _auto_sync(
-        api,
         models.Student,
-        "/afe-rostr/ims/oneroster/v1p1/students",
+        snapshot,
+        STUDENTS_ENDPOINT,
         _get_transform_students(schools),
+        digests,
+        metrics,
+        diffs,
+        ignore_digests,
+    )
+
+    _sync_enrollments(
+        snapshot,
+        schools,
+        teachers,
+        students,
+        classes,
+        digests,
+        metrics,
+        diffs,
+        ignore_digests,
     )
 
-    _sync_enrollments(api, schools, teachers, students, classes)
+    if diffs is None:
+        config.endpoint_digests = digests
+
+        phase = metrics.phase("advisory pairs")
+        started = time.monotonic()
+        phase.rows = refresh_advisory_pairs()
+        phase.write_seconds += time.monotonic() - started
+
+        # Advisee lookups are cached by ID, and a sync can change which
+        # teachers and students are active even when no pairs change
+        invalidate_advisees_cache()
+        transaction.on_commit(invalidate_advisees_cache)
+
+    for phase in metrics.phases.values():
+        log.info("Blackbaud sync phase", **asdict(phase))
 
     log.info("Blackbaud sync finished")
 
 
 def _reconcile_teacher_group(
-    teachers: set[models.Teacher],
+    teacher_emails: Iterable[str],
     group: django.contrib.auth.models.Group,
+    batch_size: Optional[int] = None,
 ):
-    """Fix up the teacher group"""
+    """Fix up the teacher group
 
-    sis_teachers_by_email = {obj.email: obj for obj in teachers}
-    users_by_email: dict[str, UserModel] = {
-        obj.email: obj
-        for obj in UserModel.objects.filter(email__in=sis_teachers_by_email.keys())
-    }
+    Missing users are created in bulk, and the group membership is diffed
+    against the through table so that only the changes are written"""
+
+    if batch_size is None:
+        batch_size = settings.SIS_SYNC_BATCH_SIZE
 
-    # Ensure all users exist
-    to_add = sis_teachers_by_email.keys() - users_by_email.keys()
+    sis_teacher_emails = set(teacher_emails)
+    existing_emails = set(
+        UserModel.objects.filter(email__in=sis_teacher_emails).values_list(
+            "email", flat=True
+        )
+    )
+
+    # Ensure all users exist. Conflicts are ignored in case a user
+    # signs in for the first time while the sync is running
+    UserModel.objects.bulk_create(
+        [UserModel(email=email) for email in sis_teacher_emails - existing_emails],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
 
-    for email in to_add:
-        users_by_email[email] = UserModel.objects.create(
-            email=email,
+    desired_user_ids = set(
+        UserModel.objects.filter(email__in=sis_teacher_emails).values_list(
+            "pk", flat=True
         )
+    )
 
-    desired_group_users = {
-        users_by_email[email] for email in sis_teachers_by_email.keys()
-    }
+    through = UserModel.groups.through
+    memberships = through.objects.filter(group=group)
+    current_user_ids = set(memberships.values_list("user_id", flat=True))
 
-    group.user_set.set(desired_group_users)
+    through.objects.bulk_create(
+        [
+            through(user_id=user_id, group_id=group.pk)
+            for user_id in desired_user_ids - current_user_ids
+        ],
+        batch_size=batch_size,
+    )
+
+    to_remove = list(current_user_ids - desired_user_ids)
+    for i in range(0, len(to_remove), batch_size):
+        memberships.filter(user_id__in=to_remove[i : i + batch_size]).delete()
 
 
 def _auto_sync(
-    api: API,
-    model: Model,
+    model: Type[Model],
+    snapshot: Snapshot,
     endpoint: str,
     transform: Callable[[Dict], Dict],
-) -> Dict[str, Model]:
-    """Perform an auto sync"""
+    digests: Dict[str, str],
+    metrics: SyncMetrics,
+    diffs: Optional[List[ModelDiff]] = None,
+    ignore_digests: bool = False,
+) -> PKMap:
+    """Perform an auto sync of a single endpoint from a snapshot
+
+    Partial endpoints only have the modified records,
+    so missing records are not deactivated"""
+
+    phase = metrics.phase(_endpoint_name(endpoint))
+
+    return _inner_sync(
+        model,
+        snapshot.records(endpoint),
+        transform,
+        partial=endpoint in snapshot.partial,
+        digests=digests,
+        metrics=phase,
+        diffs=diffs,
+        ignore_digests=ignore_digests,
+    )
+
+
+def _endpoint_name(endpoint: str) -> str:
+    return endpoint.rstrip("/").rsplit("/", 1)[-1]
 
-    sis_data = api.get(endpoint)
 
-    return _inner_sync(model, sis_data, transform)
+def _modified_since_filter(since: Optional[str]) -> Optional[str]:
+    if not since:
+        return None
+
+    # Records modified at exactly the high water mark are fetched again,
+    # since re-applying a record is harmless and missing one is not
+    return f"dateLastModified>='{since}'"
+
+
+def _track_high_water_mark(
+    rows: Iterable[Dict],
+    endpoint: str,
+    high_water_marks: Dict[str, str],
+) -> Iterator[Dict]:
+    """Pass rows through, recording the latest dateLastModified seen"""
+
+    for row in rows:
+        if modified := row.get("dateLastModified"):
+            # OneRoster timestamps are ISO 8601 in UTC, so they sort as strings
+            if modified > high_water_marks.get(endpoint, ""):
+                high_water_marks[endpoint] = modified
+
+        yield row
 
 
 def _inner_sync(
-    model: Model,
-    sis_data: Dict,
+    model: Type[Model],
+    rows: Iterable[Dict],
     transform: Callable[[Dict], Dict],
-) -> Dict[str, Model]:
-    """Perform an auto-sync using the transforms"""
-
-    fields = model._meta.get_fields()
-    many_to_many_fields = {
-        field.attname  # type: ignore[union-attr]
-        for field in fields
-        if not field.auto_created and field.many_to_many
-    }
+    batch_size: Optional[int] = None,
+    partial: bool = False,
+    digests: Optional[Dict[str, str]] = None,
+    metrics: Optional[PhaseMetrics] = None,
+    diffs: Optional[List[ModelDiff]] = None,
+    ignore_digests: bool = False,
+) -> PKMap:
+    """Perform an auto-sync using the transforms, returning the primary key of
+    every object of the model by SIS ID. See _ModelSync for how the rows
+    are applied.
+
+    When a diffs list is given nothing is written, and the
+    changes that would have been made are added to it instead."""
+
+    model_sync = _ModelSync(
+        model, transform, batch_size, partial, digests, metrics, ignore_digests
+    )
+    for row in rows:
+        model_sync.add(row)
+
+    diff = model_sync.finish(dry_run=diffs is not None)
+    if diffs is not None:
+        diffs.append(diff)
+
+    return model_sync.pks
+
+
+class _ModelSync(Generic[Model]):
+    """A streaming auto-sync of a single model
+
+    Rows are transformed as they are added, so a streaming source can be
+    consumed while it is still downloading, and several models can be fed
+    from a single pass over one source. The add, change, and deactivate sets
+    are calculated when the sync is finished and written with bulk_create and
+    bulk_update, so the number of queries scales with the batch size instead
+    of the number of rows.
+
+    Only a compact (pk, digest, active) entry is held for each existing
+    object, along with the digest of every row that was seen and the desired
+    attributes of the rows that changed. Existing objects are only loaded
+    when one of their rows has changed.
+
+    Every row's digest is stored in sis_digest, and rows whose digest matches
+    are not transformed or diffed at all. When digests are given, the digest of
+    the whole data set is kept in it by model, and the write pass is skipped
+    when it matches the last full sync and no row needs deactivating. Both digests cover TRANSFORM_VERSION,
+    and both shortcuts are skipped when the digests are ignored.
+
+    A partial sync only has the modified rows, so rows that are missing from
+    it are left alone instead of being deactivated."""
+
+    def __init__(
+        self,
+        model: Type[Model],
+        transform: Callable[[Dict], Dict],
+        batch_size: Optional[int] = None,
+        partial: bool = False,
+        digests: Optional[Dict[str, str]] = None,
+        metrics: Optional[PhaseMetrics] = None,
+        ignore_digests: bool = False,
+    ):
+        if batch_size is None:
+            batch_size = settings.SIS_SYNC_BATCH_SIZE
+
+        if metrics is None:
+            metrics = PhaseMetrics(model.__name__)
+
+        self.model = model
+        self.transform = transform
+        self.batch_size = batch_size
+        self.partial = partial
+        self.digests = digests
+        self.metrics = metrics
+        self.ignore_digests = ignore_digests
+
+        fields = model._meta.get_fields()
+        self.many_to_many_fields = {
+            field.attname  # type: ignore[union-attr]
+            for field in fields
+            if not field.auto_created and field.many_to_many
+        }
 
-    related_fields = {
-        field.name  # type: ignore[union-attr]
-        for field in fields
-        if not field.auto_created and field.many_to_one
-    }
+        self.concrete_fields = {
+            field.attname: field for field in model._meta.concrete_fields
+        }
 
-    def get_desired_attrs(row: Dict):
-        attrs = transform(row)
-        if "active" not in attrs:
-            attrs["active"] = row["status"] == "active"
+        self.existing: Dict[str, Tuple[int, str, bool]] = {
+            sis_id: (pk, digest, active)
+            for sis_id, pk, digest, active in model._default_manager.values_list(
+                "sis_id", "pk", "sis_digest", "active"
+            )
+        }
 
-        if "sis_id" not in attrs:
-            attrs["sis_id"] = row["sourcedId"]
+        # The digest of every row that was seen, even if the row couldn't be
+        # transformed, so that a bad row doesn't cause a deactivation
+        self.row_digests: Dict[str, str] = {}
+        self.desired_scalar_attrs: Dict[str, Dict] = {}
 
-        return attrs
+        # Desired many to many targets, by attribute and then by SIS ID
+        self.desired_many_to_many: DefaultDict[str, Dict[str, Set[int]]] = defaultdict(
+            dict
+        )
 
-    objs: Iterable[Model] = (
-        model.objects.all()
-        .select_related(*related_fields)
-        .prefetch_related(*many_to_many_fields)
-    )
-    objs_by_id = {obj.sis_id: obj for obj in objs}
+        # Primary keys by SIS ID once the sync is finished
+        self.pks: PKMap = {}
+
+    def add(self, row: Dict):
+        started = time.monotonic()
+
+        try:
+            self._add(row)
+        finally:
+            self.metrics.transform_seconds += time.monotonic() - started
 
-    to_add = sis_data.keys() - objs_by_id.keys()
-    to_remove = objs_by_id.keys() - sis_data.keys()
-    matched = objs_by_id.keys() & sis_data.keys()
+    def _add(self, row: Dict):
+        source_id = row["sourcedId"]
+        digest = _row_digest(row)
+        self.row_digests[source_id] = digest
 
-    for source_id in to_add:
-        row = sis_data[source_id]
+        existing = self.existing.get(source_id)
+        if existing and existing[1] == digest and not self.ignore_digests:
+            return
 
         try:
-            desired_attrs = get_desired_attrs(row)
+            desired_attrs = self._get_desired_attrs(row)
         except KeyError:
             log.exception(
                 "exception raised when calculating user's attributes, skipping", row=row
             )
-            continue
+            return
 
-        desired_scalar_attrs = {
-            k: v for k, v in desired_attrs.items() if k not in many_to_many_fields
-        }
+        desired_attrs["sis_digest"] = digest
 
-        desired_many_to_many_attrs = {
-            k: v for k, v in desired_attrs.items() if k in many_to_many_fields
+        # Values are converted up front so that, for example, a date string
+        # compares equal to the date that is already stored
+        self.desired_scalar_attrs[source_id] = {
+            k: self.concrete_fields[k].to_python(v) if k in self.concrete_fields else v
+            for k, v in desired_attrs.items()
+            if k not in self.many_to_many_fields
         }
 
-        obj = model(**desired_scalar_attrs)  # type: ignore[operator]
-        obj.save()
-        objs_by_id[source_id] = obj
+        for attr, desired_set in desired_attrs.items():
+            if attr in self.many_to_many_fields:
+                self.desired_many_to_many[attr][source_id] = set(desired_set)
 
-        # Now handle many to many
-        for attr, desired_set in desired_many_to_many_attrs.items():
-            getattr(obj, attr).set(desired_set)
+    def _get_desired_attrs(self, row: Dict) -> Dict:
+        attrs = self.transform(row)
+        if "active" not in attrs:
+            attrs["active"] = row["status"] == "active"
 
-    # Only soft delete
-    for source_id in to_remove:
-        obj = objs_by_id[source_id]
-        if obj.active:
-            obj.active = False
-            obj.save()
+        if "sis_id" not in attrs:
+            attrs["sis_id"] = row["sourcedId"]
 
-    for source_id in matched:
-        row = sis_data[source_id]
-        obj = objs_by_id[source_id]
+        return attrs
 
-        try:
-            desired_attrs = get_desired_attrs(row)
-        except KeyError:
-            log.exception(
-                "exception raised when calculating user's attributes, skipping", row=row
-            )
-            continue
+    def finish(self, dry_run: bool = False) -> ModelDiff:
+        """Write the changes, returning them as a diff. A dry run only
+        works out the diff, and gives new rows negative placeholder
+        primary keys so that later models can still refer to them."""
 
-        desired_scalar_attrs = {
-            k: v for k, v in desired_attrs.items() if k not in many_to_many_fields
-        }
+        model = self.model
+        metrics = self.metrics
+        batch_size = self.batch_size
+        desired = self.desired_scalar_attrs
+        diff = ModelDiff(model._meta.label_lower)
 
-        desired_many_to_many_attrs = {
-            k: v for k, v in desired_attrs.items() if k in many_to_many_fields
+        self.pks = {
+            source_id: existing[0] for source_id, existing in self.existing.items()
         }
 
-        do_save = False
-        for attr, desired_value in desired_scalar_attrs.items():
-            if attr in many_to_many_fields:
-                continue
-            current_value = getattr(obj, attr)
-            if current_value != desired_value:
-                setattr(obj, attr, desired_value)
-                do_save = True
+        diff_started = time.monotonic()
+
+        # Only soft delete. Clearing the digest makes sure the row
+        # is applied again if it ever comes back unchanged
+        to_deactivate: Dict[str, int] = {}
+        if not self.partial:
+            to_deactivate = {
+                source_id: pk
+                for source_id, (pk, digest, active) in self.existing.items()
+                if active and source_id not in self.row_digests
+            }
+
+        if self.digests is not None and not self.partial:
+            label = model._meta.label_lower
+            data_digest = _data_digest(self.row_digests)
+
+            # Rows added by an incremental sync since the last full sync
+            # aren't in its digest, so they still have to be deactivated
+            if (
+                not desired
+                and not to_deactivate
+                and not self.ignore_digests
+                and self.digests.get(label) == data_digest
+            ):
+                log.info("SIS data unchanged, skipping", model=model.__name__)
+                metrics.rows += len(self.row_digests)
+                return diff
+
+            self.digests[label] = data_digest
+
+        to_create = [
+            model(**desired[source_id])  # type: ignore[operator]
+            for source_id in desired.keys() - self.existing.keys()
+        ]
+
+        to_update: List[Model] = []
+        changed_fields: Set[str] = set()
+
+        matched = [
+            self.existing[source_id][0]
+            for source_id in desired.keys() & self.existing.keys()
+        ]
+
+        for i in range(0, len(matched), batch_size):
+            for obj in model._default_manager.filter(
+                pk__in=matched[i : i + batch_size]
+            ):
+                changes = {}
+                for attr, desired_value in desired[obj.sis_id].items():
+                    current_value = getattr(obj, attr)
+                    if current_value != desired_value:
+                        setattr(obj, attr, desired_value)
+                        changed_fields.add(attr)
+                        changes[attr] = (current_value, desired_value)
+
+                if changes:
+                    to_update.append(obj)
+
+                    # The digest always changes along with the row
+                    changes.pop("sis_digest", None)
+                    if dry_run and changes:
+                        diff.changed[obj.sis_id] = changes
+
+        diff.added = [obj.sis_id for obj in to_create]
+        diff.deactivated = list(to_deactivate)
+
+        metrics.transform_seconds += time.monotonic() - diff_started
+        metrics.rows += len(self.row_digests)
+        metrics.added += len(to_create)
+        metrics.changed += len(to_update)
+        metrics.deactivated += len(to_deactivate)
+
+        if dry_run:
+            for i, obj in enumerate(to_create, 1):
+                self.pks[obj.sis_id] = -i
+
+            for attr, desired_by_sis_id in self.desired_many_to_many.items():
+                diff_started = time.monotonic()
+                changes = _many_to_many_diff(
+                    model,
+                    attr,
+                    {self.pks[k]: v for k, v in desired_by_sis_id.items()},
+                    self.pks,
+                )
+                if changes:
+                    diff.many_to_many[attr] = changes
+
+                metrics.transform_seconds += time.monotonic() - diff_started
+
+            return diff
+
+        write_started = time.monotonic()
+
+        if to_create:
+            model._default_manager.bulk_create(to_create, batch_size=batch_size)
+            _ensure_primary_keys(model, to_create)
+
+        if to_update:
+            # Only the columns that changed on at least one row are written
+            model._default_manager.bulk_update(
+                to_update, sorted(changed_fields), batch_size=batch_size
+            )
 
-        if do_save:
-            obj.save()
+        deactivate_pks = list(to_deactivate.values())
+        for i in range(0, len(deactivate_pks), batch_size):
+            model._default_manager.filter(
+                pk__in=deactivate_pks[i : i + batch_size]
+            ).update(active=False, sis_digest="")
 
-        for attr, desired_value in desired_many_to_many_attrs.items():
-            current_value = getattr(obj, attr).all()
-            if set(current_value) != set(desired_value):
-                getattr(obj, attr).set(desired_value)
+        self.pks.update((obj.sis_id, obj.pk) for obj in to_create)
 
-    return objs_by_id
+        for attr, desired_by_sis_id in self.desired_many_to_many.items():
+            _reconcile_many_to_many(
+                model,
+                attr,
+                {self.pks[k]: v for k, v in desired_by_sis_id.items()},
+                batch_size,
+            )
 
+        metrics.write_seconds += time.monotonic() - write_started
 
-def _sync_enrollments(
-    api: API,
-    schools: Dict[str, models.School],
-    teachers: Dict[str, models.Teacher],
-    students: Dict[str, models.Student],
-    classes: Dict[str, models.Class],
+        log.info(
+            "Synced SIS model",
+            model=model.__name__,
+            added=len(to_create),
+            changed=len(to_update),
+            deactivated=len(to_deactivate),
+        )
+
+        return diff
+
+
+def _row_digest(row: Dict) -> str:
+    """A stable digest of a single SIS record, as transformed
+    by the current version of the transforms"""
+
+    encoded = json.dumps(row, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{TRANSFORM_VERSION}:{encoded}".encode("utf-8")).hexdigest()
+
+
+def _data_digest(row_digests: Dict[str, str]) -> str:
+    """A digest of a full data set that doesn't depend on row order"""
+
+    hasher = hashlib.sha256()
+    hasher.update(f"{TRANSFORM_VERSION}\n".encode("utf-8"))
+    for source_id, digest in sorted(row_digests.items()):
+        hasher.update(f"{source_id}:{digest}\n".encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+def _reconcile_many_to_many(
+    model: Type[Model],
+    attr: str,
+    desired: Dict[int, Set[int]],
+    batch_size: int,
 ):
-    data = api.get("/afe-rostr/ims/oneroster/v1p1/enrollments")
-
-    student_data = {k: v for k, v in data.items() if v["role"] == "student"}
-    teacher_data = {k: v for k, v in data.items() if v["role"] == "teacher"}
-
-    _inner_sync(  # type: ignore[type-var]
-        models.TeacherEnrollment,
-        teacher_data,
-        _get_transform_teacher_enrollments(
-            teachers,
-            classes,
-            schools,
-        ),
+    """Bring a many to many through table in line with the desired pairs
+
+    The through table is read once and diffed against the desired pairs for
+    every object at the same time. Objects that are not in the desired
+    mapping are left alone."""
+
+    through, source_attname, target_attname = _through(model, attr)
+    to_insert, to_delete = _many_to_many_changes(model, attr, desired)
+
+    if to_insert:
+        through.objects.bulk_create(
+            [
+                through(**{source_attname: source_pk, target_attname: target_pk})
+                for source_pk, target_pk in to_insert
+            ],
+            batch_size=batch_size,
+        )
+
+    delete_pks = list(to_delete.values())
+    for i in range(0, len(delete_pks), batch_size):
+        through.objects.filter(pk__in=delete_pks[i : i + batch_size]).delete()
+
+
+def _many_to_many_changes(
+    model: Type[Model],
+    attr: str,
+    desired: Dict[int, Set[int]],
+) -> Tuple[Set[Tuple[int, int]], Dict[Tuple[int, int], int]]:
+    """The (source, target) pairs to insert, and the through
+    table primary keys to delete by (source, target) pair"""
+
+    through, source_attname, target_attname = _through(model, attr)
+
+    current: Dict[Tuple[int, int], int] = {}
+    rows = through.objects.values_list("pk", source_attname, target_attname)
+    for through_pk, source_pk, target_pk in rows:
+        if source_pk in desired:
+            current[(source_pk, target_pk)] = through_pk
+
+    desired_pairs = {
+        (source_pk, target_pk)
+        for source_pk, target_pks in desired.items()
+        for target_pk in target_pks
+    }
+
+    to_insert = desired_pairs - current.keys()
+    to_delete = {pair: current[pair] for pair in current.keys() - desired_pairs}
+
+    return to_insert, to_delete
+
+
+def _many_to_many_diff(
+    model: Type[Model],
+    attr: str,
+    desired: Dict[int, Set[int]],
+    pks: PKMap,
+) -> Dict[str, Tuple[Set[str], Set[str]]]:
+    """The added and removed targets by SIS ID, for a dry run"""
+
+    to_insert, to_delete = _many_to_many_changes(model, attr, desired)
+
+    target_model = model._meta.get_field(attr).related_model
+    target_pks = {target for source, target in to_insert | to_delete.keys()}
+    target_ids: Dict[int, str] = dict(
+        target_model._default_manager.filter(pk__in=target_pks).values_list(  # type: ignore[union-attr]
+            "pk", "sis_id"
+        )
     )
+    sis_ids = {pk: sis_id for sis_id, pk in pks.items()}
 
-    _inner_sync(  # type: ignore[type-var]
-        models.StudentEnrollment,
-        student_data,
-        _get_transform_student_enrollments(
-            students,
-            classes,
-            schools,
-        ),
+    out: DefaultDict[str, Tuple[Set[str], Set[str]]] = defaultdict(
+        lambda: (set(), set())
     )
+    for source_pk, target_pk in to_insert:
+        out[sis_ids[source_pk]][0].add(target_ids.get(target_pk, f"new:{target_pk}"))
+
+    for source_pk, target_pk in to_delete:
+        out[sis_ids[source_pk]][1].add(target_ids.get(target_pk, f"new:{target_pk}"))
+
+    return dict(out)
+
+
+def _through(model: Type[Model], attr: str) -> Tuple[Any, str, str]:
+    """The through model of a many to many field,
+    with its source and target attribute names"""
+
+    field = model._meta.get_field(attr)
+    through = field.remote_field.through  # type: ignore[union-attr]
+    source_attname = f"{field.m2m_field_name()}_id"  # type: ignore[union-attr]
+    target_attname = f"{field.m2m_reverse_field_name()}_id"  # type: ignore[union-attr]
+
+    return through, source_attname, target_attname
+
+
+def _ensure_primary_keys(model: Type[Model], objs: List[Model]):
+    """Backfill primary keys on objects after a bulk_create
+
+    Databases that can't return rows from a bulk insert leave the
+    primary keys unset, so they get looked back up by SIS ID"""
+
+    missing = {obj.sis_id: obj for obj in objs if obj.pk is None}
+    if not missing:
+        return
+
+    rows = model._default_manager.filter(sis_id__in=missing.keys()).values_list(
+        "sis_id", "pk"
+    )
+    for sis_id, pk in rows:
+        missing[sis_id].pk = pk
+
+
+def _sync_enrollments(
+    snapshot: Snapshot,
+    schools: PKMap,
+    teachers: PKMap,
+    students: PKMap,
+    classes: PKMap,
+    digests: Dict[str, str],
+    metrics: SyncMetrics,
+    diffs: Optional[List[ModelDiff]] = None,
+    ignore_digests: bool = False,
+):
+    """Sync both kinds of enrollment from a single pass over the enrollments
+
+    Enrollment histories are by far the largest endpoint, so the records are
+    streamed from the snapshot and split by role as they are read"""
+
+    phase = metrics.phase(_endpoint_name(ENROLLMENTS_ENDPOINT))
+    partial = ENROLLMENTS_ENDPOINT in snapshot.partial
+
+    syncs: Dict[str, _ModelSync] = {
+        "teacher": _ModelSync(
+            models.TeacherEnrollment,
+            _get_transform_teacher_enrollments(teachers, classes, schools),
+            partial=partial,
+            digests=digests,
+            metrics=phase,
+            ignore_digests=ignore_digests,
+        ),
+        "student": _ModelSync(
+            models.StudentEnrollment,
+            _get_transform_student_enrollments(students, classes, schools),
+            partial=partial,
+            digests=digests,
+            metrics=phase,
+            ignore_digests=ignore_digests,
+        ),
+    }
+
+    for row in snapshot.records(ENROLLMENTS_ENDPOINT):
+        model_sync = syncs.get(row["role"])
+        if model_sync:
+            model_sync.add(row)
+
+    for model_sync in syncs.values():
+        diff = model_sync.finish(dry_run=diffs is not None)
+        if diffs is not None:
+            diffs.append(diff)
 
 
 def _transform_schools(row: Dict):
@@ -411,7 +1240,7 @@ def _transform_course(row: Dict):
     }
 
 
-def _get_transform_teachers(schools: Dict[str, models.School]):
+def _get_transform_teachers(schools: PKMap):
     def inner(row):
         return {
             "given_name": row["givenName"],
@@ -423,7 +1252,7 @@ def _get_transform_teachers(schools: Dict[str, models.School]):
     return inner
 
 
-def _get_transform_students(schools: Dict[str, models.School]):
+def _get_transform_students(schools: PKMap):
     def inner(row):
         return {
             "given_name": row["givenName"],
@@ -437,29 +1266,29 @@ def _get_transform_students(schools: Dict[str, models.School]):
 
 
 def _get_transform_classes(
-    schools: Dict[str, models.School],
-    courses: Dict[str, models.Course],
+    schools: PKMap,
+    courses: PKMap,
 ):
     def inner(row: Dict):
         return {
             "title": row["title"],
-            "school": schools[row["school"]["sourcedId"]],
-            "course": courses[row["course"]["sourcedId"]],
+            "school_id": schools[row["school"]["sourcedId"]],
+            "course_id": courses[row["course"]["sourcedId"]],
         }
 
     return inner
 
 
 def _get_transform_student_enrollments(
-    students: Dict[str, models.Student],
-    classes: Dict[str, models.Class],
-    schools: Dict[str, models.School],
+    students: PKMap,
+    classes: PKMap,
+    schools: PKMap,
 ):
     def inner(row):
         return {
-            "student": students[row["user"]["sourcedId"]],
-            "section": classes[row["class"]["sourcedId"]],
-            "school": schools[row["school"]["sourcedId"]],
+            "student_id": students[row["user"]["sourcedId"]],
+            "section_id": classes[row["class"]["sourcedId"]],
+            "school_id": schools[row["school"]["sourcedId"]],
             "begin_date": row["beginDate"],
             "end_date": row["endDate"],
         }
@@ -468,15 +1297,15 @@ def _get_transform_student_enrollments(
 
 
 def _get_transform_teacher_enrollments(
-    teachers: Dict[str, models.Teacher],
-    classes: Dict[str, models.Class],
-    schools: Dict[str, models.School],
+    teachers: PKMap,
+    classes: PKMap,
+    schools: PKMap,
 ):
     def inner(row):
         return {
-            "teacher": teachers[row["user"]["sourcedId"]],
-            "section": classes[row["class"]["sourcedId"]],
-            "school": schools[row["school"]["sourcedId"]],
+            "teacher_id": teachers[row["user"]["sourcedId"]],
+            "section_id": classes[row["class"]["sourcedId"]],
+            "school_id": schools[row["school"]["sourcedId"]],
             "begin_date": row["beginDate"],
             "end_date": row["endDate"],
         }
@@ -87,3 +87,205 @@ def test_get_advisory_courses():
     blackbaud.models.AdvisoryCourse.objects.create(course=course)
 
     assert list(advising.get_advisory_courses()) == [course]
+
+
+def _advisory_section(begin: date, end: date):
+    school = blackbaud.models.School.objects.create(
+        sis_id=uuid4().hex, active=True, name="Middle School"
+    )
+    course = blackbaud.models.Course.objects.create(
+        sis_id=uuid4().hex, active=True, title="Advisory"
+    )
+    student = blackbaud.models.Student.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Jimmy",
+        family_name="Neutron",
+        email="student@example.org",
+    )
+    student.schools.add(school)
+    teacher = blackbaud.models.Teacher.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Adam",
+        family_name="Peacock",
+        email="teacher@example.org",
+    )
+    section = blackbaud.models.Class.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        title="Peacock advising",
+        course=course,
+        school=school,
+    )
+
+    blackbaud.models.TeacherEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        section=section,
+        teacher=teacher,
+        school=school,
+        begin_date=begin - timedelta(days=10),
+        end_date=end,
+    )
+    blackbaud.models.StudentEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        section=section,
+        student=student,
+        school=school,
+        begin_date=begin,
+        end_date=end + timedelta(days=10),
+    )
+
+    return school, course, student, teacher
+
+
+@pytest.mark.django_db
+def test_advisory_pairs_cover_enrollment_overlap():
+    begin = date(2024, 9, 1)
+    end = date(2025, 6, 1)
+    school, course, student, teacher = _advisory_section(begin, end)
+
+    blackbaud.models.AdvisorySchool.objects.create(school=school)
+    blackbaud.models.AdvisoryCourse.objects.create(course=course)
+
+    pair = blackbaud.models.AdvisoryPair.objects.get()
+    assert (pair.begin_date, pair.end_date) == (begin, end)
+
+    expected = {advising.AdviseePair(student=student, teacher=teacher)}
+    assert advising.get_advisees(as_of=begin) == expected
+    assert advising.get_advisees(as_of=end) == expected
+    assert advising.get_advisees(as_of=begin - timedelta(days=1)) == set()
+    assert advising.get_advisees([teacher], [student], as_of=begin) == expected
+    assert advising.get_advisees(limit_students=[], as_of=begin) == set()
+
+    blackbaud.models.AdvisoryCourse.objects.all().delete()
+
+    assert not blackbaud.models.AdvisoryPair.objects.exists()
+
+
+@pytest.mark.django_db
+def test_get_advisees_limits_by_advisor():
+    begin = date(2024, 9, 1)
+    end = date(2025, 6, 1)
+    school, course, student, teacher = _advisory_section(begin, end)
+
+    # A former advisor of the same section, who left before the student joined
+    former = blackbaud.models.Teacher.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Former",
+        family_name="Advisor",
+        email="former@example.org",
+    )
+    blackbaud.models.TeacherEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        section=blackbaud.models.Class.objects.get(),
+        teacher=former,
+        school=school,
+        begin_date=begin - timedelta(days=365),
+        end_date=begin - timedelta(days=1),
+    )
+
+    blackbaud.models.AdvisorySchool.objects.create(school=school)
+    blackbaud.models.AdvisoryCourse.objects.create(course=course)
+
+    # Only the current advisor's pairs are returned, not the whole section's
+    assert advising.get_advisees([former], as_of=begin) == set()
+    assert advising.get_advisees([teacher, former], as_of=begin) == {
+        advising.AdviseePair(student=student, teacher=teacher)
+    }
+
+
+@pytest.mark.django_db
+def test_get_advisees_is_cached(django_assert_num_queries):
+    today = date.today()
+    school, course, student, teacher = _advisory_section(today, today)
+    blackbaud.models.AdvisorySchool.objects.create(school=school)
+    blackbaud.models.AdvisoryCourse.objects.create(course=course)
+
+    expected = {advising.AdviseePair(student=student, teacher=teacher)}
+    assert advising.get_advisees([teacher]) == expected
+
+    with django_assert_num_queries(0):
+        assert advising.get_advisees([teacher]) == expected
+        assert advising.get_advisees_by_advisors([teacher]) == {teacher: {student}}
+
+    # Invalidating, as a sync does, picks up changes to the teachers themselves
+    blackbaud.models.Teacher.objects.filter(pk=teacher.pk).update(
+        email="new@example.org"
+    )
+    advising.invalidate_advisees_cache()
+    (pair,) = advising.get_advisees([teacher])
+    assert pair.teacher.email == "new@example.org"
+
+    # Rebuilding the pairs with changes drops the cached advisees
+    blackbaud.models.StudentEnrollment.objects.update(active=False)
+    advising.refresh_advisory_pairs()
+    assert advising.get_advisees([teacher]) == set()
+
+
+@pytest.mark.django_db
+def test_advisory_pairs_skip_non_overlapping_enrollments():
+    begin = date(2024, 9, 1)
+    end = date(2025, 6, 1)
+    school, course, student, teacher = _advisory_section(begin, end)
+    section = blackbaud.models.Class.objects.get()
+
+    former = blackbaud.models.Teacher.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Former",
+        family_name="Advisor",
+        email="former@example.org",
+    )
+    blackbaud.models.TeacherEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        section=section,
+        teacher=former,
+        school=school,
+        begin_date=begin - timedelta(days=400),
+        end_date=begin - timedelta(days=1),
+    )
+    blackbaud.models.TeacherEnrollment.objects.filter(teacher=teacher).update(
+        active=False
+    )
+
+    blackbaud.models.AdvisorySchool.objects.create(school=school)
+    blackbaud.models.AdvisoryCourse.objects.create(course=course)
+
+    assert not blackbaud.models.AdvisoryPair.objects.exists()
+
+    blackbaud.models.TeacherEnrollment.objects.update(active=True)
+    advising.refresh_advisory_pairs()
+
+    pair = blackbaud.models.AdvisoryPair.objects.get()
+    assert (pair.teacher, pair.student) == (teacher, student)
+
+
+@pytest.mark.django_db
+def test_get_advisees_for_dates(django_assert_num_queries):
+    begin = date(2024, 9, 1)
+    end = date(2025, 6, 1)
+    school, course, student, teacher = _advisory_section(begin, end)
+    blackbaud.models.AdvisorySchool.objects.create(school=school)
+    blackbaud.models.AdvisoryCourse.objects.create(course=course)
+
+    before = begin - timedelta(days=1)
+    after = end + timedelta(days=1)
+    dates = [after, begin, end, before, begin]
+
+    with django_assert_num_queries(1):
+        actual = advising.get_advisees_for_dates(dates)
+
+    expected = {advising.AdviseePair(student=student, teacher=teacher)}
+    assert actual == {before: set(), begin: expected, end: expected, after: set()}
+
+    # Each date agrees with a single date lookup
+    for d in dates:
+        assert actual[d] == advising.get_advisees(as_of=d)
+
+    assert advising.get_advisees_for_dates([]) == {}
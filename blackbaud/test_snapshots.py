@@ -0,0 +1,118 @@
+"""Tests for SIS snapshots"""
+
+import json
+
+from django.contrib import messages
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.urls import reverse
+import pytest
+
+from blackbaud.models import School
+from blackbaud.snapshots import (
+    MANIFEST_NAME,
+    Snapshot,
+    SnapshotError,
+    latest_snapshot,
+    save_snapshot,
+    saved_snapshots,
+)
+from blackbaud.sync import ENDPOINTS, SCHOOLS_ENDPOINT
+
+ROWS = [
+    {"sourcedId": "a", "status": "active", "name": "A"},
+    {"sourcedId": "b", "status": "active", "name": "B"},
+]
+
+
+def _snapshot() -> Snapshot:
+    snapshot = Snapshot()
+    for endpoint in ENDPOINTS:
+        snapshot.add(endpoint, ROWS if endpoint == SCHOOLS_ENDPOINT else [])
+
+    return snapshot
+
+
+def test_snapshot_round_trip(tmp_path):
+    snapshot = Snapshot()
+    snapshot.add("/one", ROWS)
+    snapshot.add("/two", ROWS[:1], partial=True)
+    snapshot.save(tmp_path / "snapshot")
+
+    loaded = Snapshot.load(tmp_path / "snapshot")
+
+    assert loaded.endpoints == ["/one", "/two"]
+    assert loaded.partial == {"/two"}
+    assert list(loaded.records("/one")) == ROWS
+    assert list(loaded.records("/two")) == ROWS[:1]
+
+
+def test_snapshot_version_is_checked(tmp_path):
+    Snapshot().save(tmp_path / "snapshot")
+    manifest_path = tmp_path / "snapshot" / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text())
+    manifest["version"] = 0
+    manifest_path.write_text(json.dumps(manifest))
+
+    with pytest.raises(SnapshotError):
+        Snapshot.load(tmp_path / "snapshot")
+
+
+def test_saved_snapshots_are_pruned(settings, tmp_path):
+    settings.SIS_SNAPSHOT_DIR = str(tmp_path)
+    settings.SIS_SNAPSHOT_HISTORY = 2
+
+    paths = [save_snapshot(_snapshot()) for _ in range(3)]
+
+    assert saved_snapshots() == paths[1:]
+    assert latest_snapshot() == paths[-1]
+
+
+@pytest.mark.django_db
+def test_replay_command(settings, tmp_path):
+    settings.SIS_SNAPSHOT_DIR = str(tmp_path)
+    save_snapshot(_snapshot())
+
+    call_command("sis_replay", "--rollback")
+    assert not School.objects.exists()
+
+    call_command("sis_replay")
+    assert sorted(School.objects.values_list("sis_id", flat=True)) == ["a", "b"]
+
+
+@pytest.mark.django_db
+def test_diff_command(settings, tmp_path, capsys):
+    settings.SIS_SNAPSHOT_DIR = str(tmp_path)
+    save_snapshot(_snapshot())
+
+    call_command("sis_diff", "--latest")
+
+    assert "blackbaud.school: 2 added" in capsys.readouterr().out
+    assert not School.objects.exists()
+
+
+@pytest.mark.django_db
+def test_admin_dry_run_needs_a_snapshot(client, superuser, settings, tmp_path):
+    settings.SIS_SNAPSHOT_DIR = str(tmp_path)
+    client.force_login(superuser)
+
+    resp = client.get(reverse("admin:blackbaud_syncconfig_dry_run"))
+
+    assert resp.status_code == 302
+    assert resp.url == reverse("admin:blackbaud_syncconfig_change")
+    assert [m.level for m in get_messages(resp.wsgi_request)] == [messages.WARNING]
+
+
+@pytest.mark.django_db
+def test_admin_dry_run_diffs_latest_snapshot(
+    client, superuser, settings, tmp_path, static_files
+):
+    settings.SIS_SNAPSHOT_DIR = str(tmp_path)
+    path = save_snapshot(_snapshot())
+    client.force_login(superuser)
+
+    resp = client.get(reverse("admin:blackbaud_syncconfig_dry_run"))
+
+    assert resp.status_code == 200
+    assert resp.context["snapshot_path"] == path
+    assert not School.objects.exists()
@@ -1,4 +1,5 @@
-from datetime import date
+from datetime import date, timedelta
+from time import perf_counter
 import pytest
 
 from uuid import uuid4
@@ -183,3 +184,143 @@ def test_teacher_removed_on_date():
     expected = {(student, march_1): {adam, lisa}, (student, april_1): {adam}}
 
     assert actual == expected
+
+
+@pytest.mark.django_db
+def test_teacher_only_on_overlapping_dates():
+    middle_school = School.objects.create(name="Middle school", active=True)
+    student = Student.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Student",
+        family_name="1",
+        email="student1@example.org",
+    )
+    teacher = Teacher.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Adam",
+        family_name="Peacock",
+        email="mr_peacock@example.org",
+    )
+    algebra = Course.objects.create(sis_id=uuid4().hex, active=True, title="Algebra")
+    algebra_class = Class.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        title="Algebra ALG-123",
+        course=algebra,
+        school=middle_school,
+    )
+
+    # The student joins after the teacher, and the teacher leaves before the student
+    TeacherEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        teacher=teacher,
+        section=algebra_class,
+        school=middle_school,
+        begin_date=date(2022, 1, 1),
+        end_date=date(2022, 1, 20),
+    )
+    StudentEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        student=student,
+        section=algebra_class,
+        school=middle_school,
+        begin_date=date(2022, 1, 10),
+        end_date=date(2022, 1, 31),
+    )
+
+    dates = {date(2022, 1, day) for day in range(1, 32)}
+    actual = teachers_for_students([student], dates)
+
+    assert actual == {
+        (student, d): (
+            {teacher} if date(2022, 1, 10) <= d <= date(2022, 1, 20) else set()
+        )
+        for d in dates
+    }
+
+
+@pytest.mark.django_db
+def test_teachers_for_many_students(django_assert_num_queries, record_property):
+    """Benchmark of a grid sized lookup: 500 students over 30 dates"""
+
+    middle_school = School.objects.create(name="Middle school", active=True)
+    algebra = Course.objects.create(sis_id=uuid4().hex, active=True, title="Algebra")
+
+    sections = Class.objects.bulk_create(
+        Class(
+            sis_id=uuid4().hex,
+            active=True,
+            title=f"Algebra {i}",
+            course=algebra,
+            school=middle_school,
+        )
+        for i in range(25)
+    )
+    teachers = Teacher.objects.bulk_create(
+        Teacher(
+            sis_id=uuid4().hex,
+            active=True,
+            given_name="Teacher",
+            family_name=str(i),
+            email=f"teacher{i}@example.org",
+        )
+        for i in range(50)
+    )
+    students = Student.objects.bulk_create(
+        Student(
+            sis_id=uuid4().hex,
+            active=True,
+            given_name="Student",
+            family_name=str(i),
+            email=f"student{i}@example.org",
+        )
+        for i in range(500)
+    )
+
+    dates = {date(2022, 9, 1) + timedelta(days=i) for i in range(30)}
+    handover = date(2022, 9, 15)
+
+    # Every section changes teacher half way through the dates
+    TeacherEnrollment.objects.bulk_create(
+        TeacherEnrollment(
+            sis_id=uuid4().hex,
+            active=True,
+            teacher=teacher,
+            section=section,
+            school=middle_school,
+            begin_date=begin_date,
+            end_date=end_date,
+        )
+        for section, first, second in zip(sections, teachers[::2], teachers[1::2])
+        for teacher, begin_date, end_date in (
+            (first, date(2022, 8, 1), handover - timedelta(days=1)),
+            (second, handover, date(2023, 6, 1)),
+        )
+    )
+    StudentEnrollment.objects.bulk_create(
+        StudentEnrollment(
+            sis_id=uuid4().hex,
+            active=True,
+            student=student,
+            section=sections[i % len(sections)],
+            school=middle_school,
+            begin_date=date(2022, 8, 1),
+            end_date=date(2023, 6, 1),
+        )
+        for i, student in enumerate(students)
+    )
+
+    start = perf_counter()
+    with django_assert_num_queries(2):
+        actual = teachers_for_students(students, dates)
+    record_property("seconds", perf_counter() - start)
+
+    assert len(actual) == 500 * 30
+    for i in (0, 1, 499):
+        first, second = teachers[2 * (i % 25)], teachers[2 * (i % 25) + 1]
+        assert actual[(students[i], date(2022, 9, 14))] == {first}
+        assert actual[(students[i], handover)] == {second}
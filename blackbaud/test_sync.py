@@ -3,7 +3,32 @@
 from base64 import encode
 import pytest
 
-from blackbaud.sync import encode_token
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.contrib.auth.models import Group
+
+from blackbaud.instrumentation import PhaseMetrics, SyncMetrics
+from blackbaud.models import (
+    School,
+    StudentEnrollment,
+    SyncConfig,
+    Teacher,
+    TeacherEnrollment,
+)
+from blackbaud.snapshots import Snapshot
+from blackbaud import advising, sync
+from blackbaud.sync import (
+    API,
+    ENDPOINTS,
+    SCHOOLS_ENDPOINT,
+    _Page,
+    encode_token,
+    _inner_sync,
+    _modified_since_filter,
+    _track_high_water_mark,
+    _transform_schools,
+    _get_transform_teachers,
+)
 
 secret_encode_tests = [("asdf", "1234", "YXNkZjoxMjM0")]
 
@@ -12,3 +37,461 @@ secret_encode_tests = [("asdf", "1234", "YXNkZjoxMjM0")]
 def test_secret_encode(key: str, secret: str, expected: str):
     actual = encode_token(key, secret)
     assert actual == expected
+
+
+def _school_row(sis_id: str, name: str, status: str = "active") -> dict:
+    return {"sourcedId": sis_id, "status": status, "name": name}
+
+
+@pytest.mark.django_db
+def test_inner_sync_adds_changes_and_deactivates():
+    School.objects.create(sis_id="changed", active=True, name="Old name")
+    School.objects.create(sis_id="removed", active=True, name="Removed school")
+    School.objects.create(sis_id="unchanged", active=True, name="Same name")
+
+    rows = [
+        _school_row("added", "New school"),
+        _school_row("changed", "New name"),
+        _school_row("unchanged", "Same name"),
+    ]
+
+    out = _inner_sync(School, rows, _transform_schools, batch_size=2)
+
+    assert out["added"] == School.objects.get(sis_id="added").pk
+    assert School.objects.get(sis_id="added").name == "New school"
+    assert School.objects.get(sis_id="changed").name == "New name"
+    assert School.objects.get(sis_id="removed").active is False
+    assert School.objects.get(sis_id="unchanged").active is True
+    assert School.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_inner_sync_many_to_many_on_new_rows():
+    school = School.objects.create(sis_id="school", active=True, name="School")
+
+    rows = [
+        {
+            "sourcedId": "teacher",
+            "status": "active",
+            "givenName": "Adam",
+            "familyName": "Peacock",
+            "email": "adam@example.org",
+            "orgs": [{"sourcedId": "school"}],
+        }
+    ]
+
+    out = _inner_sync(Teacher, rows, _get_transform_teachers({"school": school.pk}))
+
+    assert list(Teacher.objects.get(pk=out["teacher"]).schools.all()) == [school]
+
+
+@pytest.mark.django_db
+def test_inner_sync_reconciles_many_to_many():
+    upper = School.objects.create(sis_id="upper", active=True, name="Upper")
+    middle = School.objects.create(sis_id="middle", active=True, name="Middle")
+    schools = {"upper": upper.pk, "middle": middle.pk}
+
+    def teacher_row(sis_id: str, orgs: list[str]) -> dict:
+        return {
+            "sourcedId": sis_id,
+            "status": "active",
+            "givenName": "Given",
+            "familyName": sis_id,
+            "email": f"{sis_id}@example.org",
+            "orgs": [{"sourcedId": org} for org in orgs],
+        }
+
+    transform = _get_transform_teachers(schools)
+    _inner_sync(
+        Teacher,
+        [
+            teacher_row("moves", ["upper"]),
+            teacher_row("gains", ["upper"]),
+            teacher_row("stays", ["middle"]),
+        ],
+        transform,
+    )
+
+    _inner_sync(
+        Teacher,
+        [
+            teacher_row("moves", ["middle"]),
+            teacher_row("gains", ["upper", "middle"]),
+            teacher_row("stays", ["middle"]),
+        ],
+        transform,
+    )
+
+    def school_ids(sis_id: str) -> set[str]:
+        teacher = Teacher.objects.get(sis_id=sis_id)
+        return {school.sis_id for school in teacher.schools.all()}
+
+    assert school_ids("moves") == {"middle"}
+    assert school_ids("gains") == {"upper", "middle"}
+    assert school_ids("stays") == {"middle"}
+
+
+def test_iter_records_pages(monkeypatch, settings):
+    settings.BLACKBAUD_PAGE_SIZE = 2
+    settings.BLACKBAUD_FETCH_PARALLELISM = 3
+
+    all_records = [{"sourcedId": str(i)} for i in range(7)]
+    requested_offsets: list[int] = []
+
+    def get_page(self, endpoint, headers, offset, limit, filter=None):
+        requested_offsets.append(offset)
+        return _Page(all_records[offset : offset + limit], len(all_records), 10)
+
+    monkeypatch.setattr(API, "_access_token", "token")
+    monkeypatch.setattr(API, "_get_page", get_page)
+
+    metrics = PhaseMetrics("endpoint")
+    assert list(API().iter_records("/endpoint", metrics=metrics)) == all_records
+    assert sorted(requested_offsets) == [0, 2, 4, 6]
+    assert metrics.pages == 4
+    assert metrics.bytes == 40
+
+
+def test_session_retries_rate_limits(settings):
+    settings.BLACKBAUD_MAX_RETRIES = 3
+    settings.BLACKBAUD_FETCH_PARALLELISM = 8
+    settings.BLACKBAUD_ENDPOINT_PARALLELISM = 2
+
+    with API() as api:
+        adapter = api._session.get_adapter("https://example.org/")
+
+    assert adapter.max_retries.total == 3
+    assert 429 in adapter.max_retries.status_forcelist
+    assert adapter.max_retries.respect_retry_after_header
+    assert adapter._pool_maxsize == 16
+
+
+@pytest.mark.django_db
+def test_partial_sync_keeps_missing_rows():
+    School.objects.create(sis_id="untouched", active=True, name="Untouched")
+
+    _inner_sync(
+        School,
+        [_school_row("modified", "Modified school")],
+        _transform_schools,
+        partial=True,
+    )
+
+    assert School.objects.get(sis_id="untouched").active is True
+    assert School.objects.get(sis_id="modified").active is True
+
+
+def test_track_high_water_mark():
+    rows = [
+        {"sourcedId": "1", "dateLastModified": "2024-01-02T00:00:00.000Z"},
+        {"sourcedId": "2", "dateLastModified": "2024-03-01T00:00:00.000Z"},
+        {"sourcedId": "3"},
+    ]
+    marks = {"/endpoint": "2024-02-01T00:00:00.000Z"}
+
+    assert list(_track_high_water_mark(rows, "/endpoint", marks)) == rows
+    assert marks == {"/endpoint": "2024-03-01T00:00:00.000Z"}
+
+
+def test_modified_since_filter():
+    assert _modified_since_filter(None) is None
+    assert (
+        _modified_since_filter("2024-03-01T00:00:00.000Z")
+        == "dateLastModified>='2024-03-01T00:00:00.000Z'"
+    )
+
+
+@pytest.mark.django_db
+def test_unchanged_rows_are_skipped():
+    rows = [_school_row("school", "School")]
+    digests: dict[str, str] = {}
+
+    _inner_sync(School, rows, _transform_schools, digests=digests)
+    assert "blackbaud.school" in digests
+
+    # A matching digest means the row isn't looked at again,
+    # so a local change survives the sync
+    School.objects.filter(sis_id="school").update(name="Local name")
+    _inner_sync(School, rows, _transform_schools, digests=digests)
+    assert School.objects.get(sis_id="school").name == "Local name"
+
+    # Unless the digests are ignored
+    _inner_sync(School, rows, _transform_schools, digests=digests, ignore_digests=True)
+    assert School.objects.get(sis_id="school").name == "School"
+
+    # A changed row is applied
+    _inner_sync(School, [_school_row("school", "New name")], _transform_schools)
+    assert School.objects.get(sis_id="school").name == "New name"
+
+
+@pytest.mark.django_db
+def test_unchanged_row_is_reactivated():
+    rows = [_school_row("school", "School")]
+
+    _inner_sync(School, rows, _transform_schools)
+    _inner_sync(School, [], _transform_schools)
+    assert School.objects.get(sis_id="school").active is False
+
+    _inner_sync(School, rows, _transform_schools)
+    assert School.objects.get(sis_id="school").active is True
+
+
+@pytest.mark.django_db
+def test_inner_sync_metrics():
+    School.objects.create(sis_id="changed", active=True, name="Old name")
+    School.objects.create(sis_id="removed", active=True, name="Removed")
+
+    metrics = PhaseMetrics("schools")
+    rows = [_school_row("added", "Added"), _school_row("changed", "New name")]
+    _inner_sync(School, rows, _transform_schools, metrics=metrics)
+
+    assert metrics.rows == 2
+    assert metrics.added == 1
+    assert metrics.changed == 1
+    assert metrics.deactivated == 1
+
+
+@pytest.mark.django_db
+def test_sync_runs_are_recorded_and_pruned(settings):
+    settings.SIS_SYNC_RUN_HISTORY = 2
+    config = SyncConfig.get_solo()
+
+    for _ in range(3):
+        metrics = SyncMetrics()
+        metrics.start(incremental=True)
+        metrics.phase("schools").added = 1
+        metrics.finish()
+        run = metrics.record(config)
+
+    assert config.runs.count() == 2
+    assert run.success
+    assert [phase.added for phase in run.phases.all()] == [1]
+
+
+def _snapshot(schools: list, partial: bool = False) -> Snapshot:
+    snapshot = Snapshot()
+    for endpoint in ENDPOINTS:
+        records = schools if endpoint == SCHOOLS_ENDPOINT else []
+        snapshot.add(endpoint, records, partial=partial)
+
+    return snapshot
+
+
+@pytest.mark.django_db
+def test_auto_sync_applies_fetched_snapshot(monkeypatch):
+    def fake_fetch(high_water_marks, metrics):
+        # An admin edit made while the download is in progress
+        SyncConfig.objects.update(sync_enabled=False)
+        high_water_marks[SCHOOLS_ENDPOINT] = "2024-01-01T00:00:00Z"
+        return _snapshot([_school_row("school", "School")])
+
+    monkeypatch.setattr(sync, "_fetch", fake_fetch)
+
+    sync.auto_sync(force=True, full=True)
+
+    config = SyncConfig.objects.get()
+    assert not config.sync_enabled
+    assert config.last_full_sync
+    assert config.high_water_marks == {SCHOOLS_ENDPOINT: "2024-01-01T00:00:00Z"}
+    assert School.objects.get().name == "School"
+    assert config.runs.get().success
+
+
+@pytest.mark.django_db
+def test_apply_partial_snapshot_keeps_missing_rows():
+    config = SyncConfig.get_solo()
+
+    sync._apply(config, _snapshot([_school_row("a", "A"), _school_row("b", "B")]))
+    sync._apply(config, _snapshot([_school_row("a", "A2")], partial=True))
+
+    assert dict(School.objects.values_list("sis_id", "name")) == {"a": "A2", "b": "B"}
+    assert School.objects.filter(active=True).count() == 2
+
+
+@pytest.mark.django_db
+def test_apply_invalidates_advisees_cache():
+    config = SyncConfig.get_solo()
+    sync._apply(config, _snapshot([_school_row("a", "A")]))
+    version = cache.get(advising.CACHE_VERSION_KEY)
+
+    # Nothing changes, but the cache is still dropped
+    sync._apply(config, _snapshot([_school_row("a", "A")]))
+    assert cache.get(advising.CACHE_VERSION_KEY) != version
+
+
+def _person_row(sis_id: str, **extra) -> dict:
+    return {
+        "sourcedId": sis_id,
+        "status": "active",
+        "givenName": "Given",
+        "familyName": sis_id,
+        "email": f"{sis_id}@example.org",
+        "orgs": [{"sourcedId": "school"}],
+        **extra,
+    }
+
+
+def _enrollment_row(sis_id: str, role: str, user: str) -> dict:
+    return {
+        "sourcedId": sis_id,
+        "status": "active",
+        "role": role,
+        "user": {"sourcedId": user},
+        "class": {"sourcedId": "class"},
+        "school": {"sourcedId": "school"},
+        "beginDate": "2024-09-01",
+        "endDate": "2025-06-01",
+    }
+
+
+def _roster_snapshot(enrollments: list) -> Snapshot:
+    snapshot = Snapshot()
+    snapshot.add(SCHOOLS_ENDPOINT, [_school_row("school", "School")])
+    snapshot.add(
+        sync.COURSES_ENDPOINT,
+        [{"sourcedId": "course", "status": "active", "title": "Course"}],
+    )
+    snapshot.add(
+        sync.CLASSES_ENDPOINT,
+        [
+            {
+                "sourcedId": "class",
+                "status": "active",
+                "title": "Class",
+                "school": {"sourcedId": "school"},
+                "course": {"sourcedId": "course"},
+            }
+        ],
+    )
+    snapshot.add(sync.TEACHERS_ENDPOINT, [_person_row("teacher")])
+    snapshot.add(
+        sync.STUDENTS_ENDPOINT, [_person_row("student", metadata={"grade": "9"})]
+    )
+    snapshot.add(sync.ENROLLMENTS_ENDPOINT, enrollments)
+
+    return snapshot
+
+
+@pytest.mark.django_db
+def test_apply_splits_enrollments_by_role():
+    config = SyncConfig.get_solo()
+    enrollments = [
+        _enrollment_row("te", "teacher", "teacher"),
+        _enrollment_row("se", "student", "student"),
+        _enrollment_row("ae", "aide", "teacher"),
+    ]
+
+    sync._apply(config, _roster_snapshot(enrollments))
+
+    assert TeacherEnrollment.objects.get().teacher.sis_id == "teacher"
+    assert StudentEnrollment.objects.get().student.sis_id == "student"
+
+    sync._apply(config, _roster_snapshot(enrollments[1:]))
+
+    assert not TeacherEnrollment.objects.get().active
+    assert StudentEnrollment.objects.get().active
+
+
+def test_fetch_downloads_every_endpoint(monkeypatch, settings):
+    settings.BLACKBAUD_ENDPOINT_PARALLELISM = 3
+
+    def fake_iter_records(self, endpoint, filter=None, metrics=None):
+        yield {"sourcedId": endpoint, "dateLastModified": "2024-01-01T00:00:00Z"}
+
+    monkeypatch.setattr(API, "iter_records", fake_iter_records)
+
+    marks: dict[str, str] = {SCHOOLS_ENDPOINT: "2023-01-01T00:00:00Z"}
+    with sync._fetch(marks, SyncMetrics()) as snapshot:
+        assert sorted(snapshot.endpoints) == sorted(ENDPOINTS)
+        assert snapshot.partial == {SCHOOLS_ENDPOINT}
+        for endpoint in ENDPOINTS:
+            assert [r["sourcedId"] for r in snapshot.records(endpoint)] == [endpoint]
+
+    assert marks == {endpoint: "2024-01-01T00:00:00Z" for endpoint in ENDPOINTS}
+
+
+@pytest.mark.django_db
+def test_reconcile_teacher_group():
+    group = Group.objects.create(name="Teachers")
+    existing = get_user_model().objects.create(email="existing@example.org")
+    former = get_user_model().objects.create(email="former@example.org")
+    former.groups.add(group)
+
+    sync._reconcile_teacher_group(
+        ["existing@example.org", "new@example.org"], group, batch_size=1
+    )
+
+    assert set(group.user_set.values_list("email", flat=True)) == {
+        "existing@example.org",
+        "new@example.org",
+    }
+    assert get_user_model().objects.count() == 3
+    assert existing.groups.get() == group
+
+
+@pytest.mark.django_db
+def test_dry_run_does_not_write():
+    enrollments = [_enrollment_row("se", "student", "student")]
+    diffs, metrics = sync.dry_run(_roster_snapshot(enrollments))
+
+    assert not School.objects.exists()
+    assert not StudentEnrollment.objects.exists()
+
+    by_model = {diff.model: diff for diff in diffs}
+    assert by_model["blackbaud.school"].added == ["school"]
+    assert by_model["blackbaud.studentenrollment"].added == ["se"]
+    assert by_model["blackbaud.teacher"].many_to_many == {
+        "schools": {"teacher": ({"new:-1"}, set())}
+    }
+    assert metrics.phases["enrollments"].rows == 1
+
+
+@pytest.mark.django_db
+def test_dry_run_field_changes():
+    config = SyncConfig.get_solo()
+    sync._apply(config, _roster_snapshot([]))
+
+    snapshot = _roster_snapshot([])
+    snapshot.add(SCHOOLS_ENDPOINT, [_school_row("school", "Renamed")])
+    diffs, _ = sync.dry_run(snapshot)
+
+    (school_diff,) = [diff for diff in diffs if diff]
+    assert school_diff.changed == {"school": {"name": ("School", "Renamed")}}
+    assert School.objects.get().name == "School"
+
+
+@pytest.mark.django_db
+def test_transform_version_changes_digests(monkeypatch):
+    rows = [_school_row("school", "School")]
+    digests: dict[str, str] = {}
+
+    _inner_sync(School, rows, _transform_schools, digests=digests)
+    School.objects.filter(sis_id="school").update(name="Local name")
+
+    # A new version of the transforms reapplies every row
+    monkeypatch.setattr(sync, "TRANSFORM_VERSION", sync.TRANSFORM_VERSION + 1)
+    _inner_sync(School, rows, _transform_schools, digests=digests)
+    assert School.objects.get(sis_id="school").name == "School"
+
+
+@pytest.mark.django_db
+def test_unchanged_full_sync_deactivates_incremental_rows():
+    rows = [_school_row("a", "A")]
+    digests: dict[str, str] = {}
+
+    _inner_sync(School, rows, _transform_schools, digests=digests)
+
+    # An incremental sync adds a row that the SIS later deletes
+    _inner_sync(
+        School,
+        [_school_row("b", "B")],
+        _transform_schools,
+        partial=True,
+        digests=digests,
+    )
+    assert School.objects.get(sis_id="b").active is True
+
+    # The next full sync matches the stored digest, but still deactivates it
+    _inner_sync(School, rows, _transform_schools, digests=digests)
+    assert School.objects.get(sis_id="b").active is False
+    assert School.objects.get(sis_id="a").active is True
@@ -5,6 +5,7 @@ import uuid
 import tempfile
 import shutil
 from contextlib import contextmanager
+from django.core.cache import cache
 from django.core.management import call_command
 from django.test import override_settings
 
@@ -36,3 +37,11 @@ def superuser() -> User:
 def static_files():
     with static_files_context():
         yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Keep cached values, such as advisees, from leaking between tests"""
+
+    cache.clear()
+    yield
@@ -67,8 +67,44 @@ BLACKBAUD_API_BASE = env("BLACKBAUD_API_BASE", default=None)
 BLACKBAUD_OAUTH_KEY = env("BLACKBAUD_OAUTH_KEY", default=None)
 BLACKBAUD_OAUTH_SECRET = env("BLACKBAUD_OAUTH_SECRET", default=None)
 
+# Page size and concurrent page requests used while downloading from the SIS
+BLACKBAUD_PAGE_SIZE = env.int("BLACKBAUD_PAGE_SIZE", default=100)
+BLACKBAUD_FETCH_PARALLELISM = env.int("BLACKBAUD_FETCH_PARALLELISM", default=4)
+
+# How many endpoints are downloaded at the same time, each with its own page requests
+BLACKBAUD_ENDPOINT_PARALLELISM = env.int("BLACKBAUD_ENDPOINT_PARALLELISM", default=3)
+
+# Connection pooling and retry behavior for the SIS API client
+BLACKBAUD_POOL_SIZE = env.int("BLACKBAUD_POOL_SIZE", default=4)
+BLACKBAUD_MAX_RETRIES = env.int("BLACKBAUD_MAX_RETRIES", default=5)
+BLACKBAUD_RETRY_BACKOFF = env.float("BLACKBAUD_RETRY_BACKOFF", default=0.5)
+
 SIS_SYNC_INTERVAL = env.int("SIS_SYNC_INTERVAL", default=3600)
 
+# Syncs in between full syncs only ask for records modified since the last sync,
+# so deletions are only picked up by a full sync
+SIS_FULL_SYNC_INTERVAL = env.int("SIS_FULL_SYNC_INTERVAL", default=86400)
+
+# How many rows are sent per bulk INSERT/UPDATE statement during the SIS sync
+SIS_SYNC_BATCH_SIZE = env.int("SIS_SYNC_BATCH_SIZE", default=500)
+
+# How many sync runs, with their timings, are kept for the admin
+SIS_SYNC_RUN_HISTORY = env.int("SIS_SYNC_RUN_HISTORY", default=50)
+
+# Where fetched SIS data is saved for replaying with sis_replay, off when empty.
+# Snapshots hold student data, so keep this somewhere private
+SIS_SNAPSHOT_DIR = env("SIS_SNAPSHOT_DIR", default=None)
+SIS_SNAPSHOT_HISTORY = env.int("SIS_SNAPSHOT_HISTORY", default=3)
+
+# How long advisee lookups are cached. A sync clears the cache, but with the
+# default per-process cache only in the process that ran it, so this is how
+# long other processes can serve stale advisees. A shared cache can go longer
+ADVISEES_CACHE_TIMEOUT = env.int("ADVISEES_CACHE_TIMEOUT", default=300)
+
+# How many advisees are in each chunk of the enrichment assignment grids. The
+# first chunk is rendered with the page, and the rest are loaded as it scrolls
+ENRICHMENT_GRID_PAGE_SIZE = env.int("ENRICHMENT_GRID_PAGE_SIZE", default=50)
+
 STORAGES = {
     "default": {
         "BACKEND": env(
@@ -25,7 +25,11 @@ from enrichment.slots import (
     StudentID,
 )
 from stored_mail.models import OutgoingMessage, RelatedAddress, ExtraHeader
-from blackbaud.advising import get_advisees_by_advisors, get_advisees
+from blackbaud.advising import (
+    get_advisees_by_advisors,
+    get_advisees,
+    get_advisees_for_dates,
+)
 from blackbaud.models import Student, Teacher
 from django.template.loader import render_to_string, TemplateDoesNotExist
 from django.utils import timezone
@@ -120,18 +124,9 @@ class OutgoingEmail(NamedTuple):
 def unassigned_admin(cfg: EmailConfig, slots: set[Slot]) -> Iterable[OutgoingEmail]:
     """Generate report for unassigned advisees to admins"""
 
-    advisees_by_advisor = get_advisees_by_advisors()
-
-    advisors_by_advisees: dict[Student, set[Teacher]] = {}
-    all_students: set[Student] = set()
-
-    for advisor, advisees in advisees_by_advisor.items():
-        for student in advisees:
-            if student not in advisors_by_advisees:
-                advisors_by_advisees[student] = set()
-
-            advisors_by_advisees[student].add(advisor)
-            all_students.add(student)
+    # Advisees are looked up on each slot's own date, since
+    # a report can span a change in advisory assignments
+    advisees_by_date = get_advisees_for_dates(slot.date for slot in slots)
 
     all_signups = {
         (SlotID(row["slot_id"]), StudentID(row["student_id"]))
@@ -146,13 +141,13 @@ def unassigned_admin(cfg: EmailConfig, slots: set[Slot]) -> Iterable[OutgoingEma
         unassigned_by_slot[slot] = set()
         slot_id = SlotID(slot.pk)
 
-        for student in all_students:
-            student_id = StudentID(student.pk)
+        for pair in advisees_by_date[slot.date]:
+            student_id = StudentID(pair.student.pk)
             key = (slot_id, student_id)
 
             if key not in all_signups:
-                unassigned_by_slot[slot].add(student)
-                unassigned_students.add(student)
+                unassigned_by_slot[slot].add(pair.student)
+                unassigned_students.add(pair.student)
 
     organized: list[tuple[Slot, list[tuple[Teacher, list[Student]]]]] = []
 
@@ -160,6 +155,10 @@ def unassigned_admin(cfg: EmailConfig, slots: set[Slot]) -> Iterable[OutgoingEma
     for slot in sorted(slots, key=lambda slot: slot.date):
         organized_slot: list[tuple[Teacher, list[Student]]] = []
 
+        advisees_by_advisor: DefaultDict[Teacher, set[Student]] = defaultdict(set)
+        for pair in advisees_by_date[slot.date]:
+            advisees_by_advisor[pair.teacher].add(pair.student)
+
         teachers = sorted(
             advisees_by_advisor.keys(),
             key=lambda teacher: (teacher.family_name, teacher.given_name),
@@ -194,10 +193,16 @@ def unassigned_admin(cfg: EmailConfig, slots: set[Slot]) -> Iterable[OutgoingEma
 def unassigned_advisor(cfg: EmailConfig, slots: set[Slot]) -> Iterable[OutgoingEmail]:
     """Generate reports for unassigned advisees to advisors"""
 
-    data = get_advisees_by_advisors()
-    all_students: set[Student] = set()
-    for students in data.values():
-        all_students.update(students)
+    # Advisees are looked up on each slot's own date, since
+    # a report can span a change in advisory assignments
+    advisees_by_date = get_advisees_for_dates(slot.date for slot in slots)
+    data: DefaultDict[Teacher, DefaultDict[Slot, set[Student]]] = defaultdict(
+        lambda: defaultdict(set)
+    )
+
+    for slot in slots:
+        for pair in advisees_by_date[slot.date]:
+            data[pair.teacher][slot].add(pair.student)
 
     all_signups = {
         (SlotID(row["slot_id"]), StudentID(row["student_id"]))
@@ -212,14 +217,14 @@ def unassigned_advisor(cfg: EmailConfig, slots: set[Slot]) -> Iterable[OutgoingE
 def _unassigned_for_advisor(
     cfg: EmailConfig,
     advisor: Teacher,
-    advisees: set[Student],
+    advisees_by_slot: dict[Slot, set[Student]],
     slots: set[Slot],
     all_signups: _SignupIDs,
 ) -> OutgoingEmail | None:
     unassigned_students: set[Student] = set()
     context_dict: DefaultDict[Slot, set[Student]] = defaultdict(set)
 
-    for slot in slots:
+    for slot, advisees in advisees_by_slot.items():
         slot_id = SlotID(slot.pk)
         for student in advisees:
             student_id = StudentID(student.pk)
@@ -1,5 +1,6 @@
 """Slot calculation options"""
 
+from bisect import bisect_left, bisect_right
 from datetime import date, datetime
 from functools import cached_property
 from types import MappingProxyType
@@ -16,8 +17,9 @@ from typing import (
 
 from frozendict.core import frozendict
 
-from django.db.models import QuerySet, Q
+from django.db.models import Model, Q
 from django.utils import timezone
+from django.utils.formats import date_format
 
 from accounts.models import User
 from blackbaud.models import Student, Teacher
@@ -37,10 +39,6 @@ class GridTeacher(NamedTuple):
     first_name: str
     email: str
 
-    @property
-    def jsonable(self) -> dict:
-        return {f: getattr(self, f) for f in self._fields}
-
     @property
     def formal_name(self) -> str:
         if self.honorific:
@@ -106,24 +104,6 @@ class GridOption(NamedTuple):
 
         return self.teacher.name
 
-    @property
-    def jsonable(self) -> dict:
-        out: dict = {}
-
-        for field in self._fields:
-            val = getattr(self, field)
-            if isinstance(val, (set, frozenset)):
-                val = list(val)
-
-            if isinstance(val, frozendict):
-                val = dict(val)
-
-            out[field] = val
-
-        out["teacher"] = self.teacher.jsonable
-        out["display"] = self.display
-        return out
-
     @property
     def sort_key(self) -> tuple:
         return self.teacher.sort_key
@@ -141,6 +121,10 @@ class GridStudent(NamedTuple):
             return f"{self.nickname} {self.last_name}"
         return f"{self.first_name} {self.last_name}"
 
+    @property
+    def jsonable(self) -> dict:
+        return {"id": self.id, "name": self.name}
+
     @property
     def sort_key(self) -> tuple:
         if self.nickname:
@@ -320,7 +304,14 @@ class GridGenerator:
 
     @cached_property
     def all_options(self) -> Set[GridOption]:
-        out: Set[GridOption] = set()
+        return set(self.availability)
+
+    @cached_property
+    def availability(self) -> Dict[GridOption, int]:
+        """The slots each option is available on, as a bitmask
+        where bit i is set when the option is available on self.slots[i]"""
+
+        out: Dict[GridOption, int] = {}
 
         used_ids = {signup.option_id for signup in self._raw_signups}
         relevant_option_query = Q(pk__in=used_ids)
@@ -336,45 +327,38 @@ class GridGenerator:
 
         # Our query should now get us and option that was in used and any option
         # that might be relevant given our slot date ranges
-        options: QuerySet[Option] = (
+        options: List[Option] = list(
             Option.objects.filter(relevant_option_query)
-            .prefetch_related(
-                "only_available_on", "not_available_on", "location_overrides"
-            )
+            .prefetch_related("location_overrides")
             .select_related("teacher")
         )
 
-        for obj in options:
-            id = OptionID(obj.pk)
-            not_available_on_ids: Set[SlotID] = set()
-            only_available_on_ids: Set[SlotID] = set()
-            location_overrides_by_id: Dict[SlotID, str] = {}
+        # The slot restrictions come straight from the through tables,
+        # limited to the slots in this grid, as a mask for each option
+        option_ids = [obj.pk for obj in options]
+        not_available_on = self._slot_masks(Option.not_available_on.through, option_ids)
+        only_available_on = self._slot_masks(
+            Option.only_available_on.through, option_ids
+        )
 
-            for db_slot in obj.not_available_on.all():
-                not_available_on_ids.add(SlotID(db_slot.pk))
+        slot_dates = [slot.date for slot in self.slots]
 
-            for db_slot in obj.only_available_on.all():
-                only_available_on_ids.add(SlotID(db_slot.pk))
+        for obj in options:
+            id = OptionID(obj.pk)
+            exclude_mask = not_available_on.get(id, 0)
+            only_mask = only_available_on.get(id, 0)
 
+            location_overrides_by_id: Dict[SlotID, str] = {}
             for db_override in obj.location_overrides.all():
                 location_overrides_by_id[SlotID(db_override.slot_id)] = (
                     db_override.location
                 )
 
             teacher = _teacher_to_grid(obj.teacher)
-            exclude_from = {
-                slot
-                for slot_id, slot in self.slots_by_id.items()
-                if slot_id in not_available_on_ids
-            }
-            only_available_on = {
-                slot
-                for slot_id, slot in self.slots_by_id.items()
-                if slot_id in only_available_on_ids
-            }
             location_overrides = {
                 self.slots_by_id[slot_id]: location
                 for (slot_id, location) in location_overrides_by_id.items()
+                if slot_id in self.slots_by_id
             }
 
             option = GridOption(
@@ -385,24 +369,63 @@ class GridGenerator:
                 start_date=obj.start_date,
                 end_date=obj.end_date,
                 admin_only=obj.admin_only,
-                exclude_from=frozenset(exclude_from),
-                only_available_on=frozenset(only_available_on),
+                exclude_from=frozenset(self._slots_in_mask(exclude_mask)),
+                only_available_on=frozenset(self._slots_in_mask(only_mask)),
                 location_overrides=frozendict(location_overrides),  # type: ignore
             )
-            out.add(option)
+
+            # Slots are sorted by date, so the slots within the option's
+            # dates are a contiguous run of bits
+            first = bisect_left(slot_dates, obj.start_date)
+            last = len(slot_dates)
+            if obj.end_date:
+                last = bisect_right(slot_dates, obj.end_date)
+
+            mask = ((1 << max(last - first, 0)) - 1) << first
+            mask &= ~exclude_mask
+            if only_mask:
+                mask &= only_mask
+
+            out[option] = mask
+
+        return out
+
+    def _slot_masks(
+        self, through: type[Model], option_ids: List[int]
+    ) -> Dict[OptionID, int]:
+        """Slot bitmasks by option, from an option/slot through table"""
+
+        slot_bits = {slot.id: 1 << i for i, slot in enumerate(self.slots)}
+        out: Dict[OptionID, int] = {}
+
+        rows = through._default_manager.filter(
+            option_id__in=option_ids, slot_id__in=slot_bits.keys()
+        ).values_list("option_id", "slot_id")
+
+        for option_id, slot_id in rows:
+            out[OptionID(option_id)] = (
+                out.get(OptionID(option_id), 0) | slot_bits[slot_id]
+            )
+
+        return out
+
+    def _slots_in_mask(self, mask: int) -> List[GridSlot]:
+        out: List[GridSlot] = []
+
+        while mask:
+            low = mask & -mask
+            out.append(self.slots[low.bit_length() - 1])
+            mask ^= low
 
         return out
 
     @cached_property
     def options_by_slot(self) -> Dict[GridSlot, Set[GridOption]]:
-        out: Dict[GridSlot, set[GridOption]] = {}
+        out: Dict[GridSlot, set[GridOption]] = {slot: set() for slot in self.slots}
 
-        for slot in self.slots:
-            out[slot] = set()
-
-            for option in self.all_options:
-                if option.is_available_for_slot(slot):
-                    out[slot].add(option)
+        for option, mask in self.availability.items():
+            for slot in self._slots_in_mask(mask):
+                out[slot].add(option)
 
         return out
 
@@ -411,80 +434,186 @@ class GridGenerator:
         return {obj.id: obj for obj in self.all_options}
 
     @property
-    def options_for_json(self) -> Dict[OptionID, dict]:
-        return {obj.id: obj.jsonable for obj in self.all_options}
+    def compact_jsonable(self) -> dict:
+        """The grid as normalized arrays, for the assignment pages to render
+
+        Options are listed once and referred to by their index. Each slot
+        lists the options the user can assign on it, in display order, and
+        each cell is [preferred, current option, flags]. preferred is a
+        bitmask over the slot's options in hex, since it can be wider than
+        a JavaScript number, and flags has 1 set when the cell is editable
+        and 2 set when it is admin locked."""
+
+        options = sorted(self.all_options, key=lambda opt: (opt.sort_key, opt.id))
+        option_index = {opt: i for i, opt in enumerate(options)}
+
+        # Cells on a slot with the same preferred options share their mask
+        masks: Dict[Tuple[GridSlot, Tuple[int, ...]], str] = {}
+
+        def preferred_mask(cell: GridRowSlot) -> str:
+            key = (cell.slot, tuple(cell.preferred_option_ids))
+            if key not in masks:
+                preferred = set(cell.preferred_options)
+                mask = 0
+                for i, opt in enumerate(self._sorted_options_by_slot[cell.slot]):
+                    if opt in preferred:
+                        mask |= 1 << i
+
+                masks[key] = format(mask, "x")
+
+            return masks[key]
+
+        def cell_jsonable(cell: GridRowSlot) -> list:
+            current = None
+            if cell.currently_selected:
+                current = option_index[cell.currently_selected.current_option]
+
+            flags = (1 if cell.editable else 0) | (2 if cell.admin_locked else 0)
+            return [preferred_mask(cell), current, flags]
+
+        return {
+            "options": [{"id": opt.id, "display": opt.display} for opt in options],
+            "slots": [
+                {
+                    "id": slot.id,
+                    "date": slot.date,
+                    "display": date_format(slot.date),
+                    "description": slot.description,
+                }
+                for slot in self.slots
+            ],
+            "slot_options": [
+                [option_index[opt] for opt in self._sorted_options_by_slot[slot]]
+                for slot in self.slots
+            ],
+            "students": [student.jsonable for student in self.students],
+            "cells": [
+                [
+                    cell_jsonable(self.grid_row_slot(student, slot))
+                    for slot in self.slots
+                ]
+                for student in self.students
+            ],
+            "allow_locking": self._can_set_admin_locked,
+        }
 
     @cached_property
-    def grid_row_slots(self) -> Dict[Tuple[GridStudent, GridSlot], GridRowSlot]:
-        out: Dict[Tuple[GridStudent, GridSlot], GridRowSlot] = {}
-
-        organized_signups = {(row.slot.id, row.student.id): row for row in self.signups}
-
-        def get_grid_row(student: GridStudent, slot: GridSlot) -> GridRowSlot:
-            current_signup_data = organized_signups.get((slot.id, student.id))
-            current_signup: Optional[CurrentSelection] = None
-            if current_signup_data:
-                current_signup = CurrentSelection(
-                    slot,
-                    self.options_by_id[current_signup_data.option.id],
-                    current_signup_data.admin_locked,
-                )
+    def _sorted_options_by_slot(self) -> Dict[GridSlot, List[GridOption]]:
+        """The options the user can assign on each slot, sorted by teacher"""
+
+        out: Dict[GridSlot, List[GridOption]] = {}
 
-            def is_editable() -> bool:
-                if slot.editable_until < timezone.now() and not self._edit_past_lockout:
-                    return False
-
-                if (
-                    current_signup_data
-                    and current_signup_data.admin_locked
-                    and not self._can_set_admin_locked
-                ):
-                    return False
-
-                # If a student is set to an admin only option and the
-                # editor can't use admin only options, that's a lock
-                if (
-                    current_signup
-                    and current_signup.current_option.admin_only
-                    and not self._alow_admin_only
-                ):
-                    return False
-
-                return True
-
-            all_options = self.options_by_slot[slot]
+        for slot, options in self.options_by_slot.items():
             if not self._alow_admin_only:
-                all_options -= {opt for opt in all_options if opt.admin_only}
+                options = {opt for opt in options if not opt.admin_only}
 
-            preferred_teachers = self.student_teacher_associations[(student, slot.date)]
+            out[slot] = sorted(options, key=lambda opt: opt.sort_key)
 
-            preferred_options = {
-                opt for opt in all_options if opt.teacher in preferred_teachers
-            }
-            remaining_options = all_options - preferred_options
+        return out
 
-            return GridRowSlot(
-                student=student,
-                slot=slot,
-                currently_selected=current_signup,
-                preferred_options=sorted(
-                    preferred_options,
-                    key=lambda opt: (opt.teacher.last_name, opt.teacher.first_name),
-                ),
-                remaining_options=sorted(
-                    remaining_options,
-                    key=lambda opt: (opt.teacher.last_name, opt.teacher.first_name),
-                ),
-                editable=is_editable(),
+    @cached_property
+    def _option_partitions(
+        self,
+    ) -> Dict[
+        Tuple[GridSlot, FrozenSet[GridTeacher]],
+        Tuple[List[GridOption], List[GridOption]],
+    ]:
+        return {}
+
+    def _partition_options(
+        self, slot: GridSlot, preferred_teachers: FrozenSet[GridTeacher]
+    ) -> Tuple[List[GridOption], List[GridOption]]:
+        """The preferred and remaining options on a slot, each sorted by teacher
+
+        Most students on a slot share their teachers with others, such as
+        the rest of an advisory, so the split is only made once for each
+        slot and set of teachers. The lists are shared between grid cells."""
+
+        key = (slot, preferred_teachers)
+        if key not in self._option_partitions:
+            preferred: List[GridOption] = []
+            remaining: List[GridOption] = []
+
+            for opt in self._sorted_options_by_slot[slot]:
+                if opt.teacher in preferred_teachers:
+                    preferred.append(opt)
+                else:
+                    remaining.append(opt)
+
+            self._option_partitions[key] = (preferred, remaining)
+
+        return self._option_partitions[key]
+
+    @cached_property
+    def _signups_by_cell(self) -> Dict[Tuple[SlotID, StudentID], GridSignup]:
+        return {(row.slot.id, row.student.id): row for row in self.signups}
+
+    @cached_property
+    def _grid_row_slot_cache(self) -> Dict[Tuple[GridStudent, GridSlot], GridRowSlot]:
+        return {}
+
+    def grid_row_slot(self, student: GridStudent, slot: GridSlot) -> GridRowSlot:
+        """A single grid cell, which is only worked out when it is first asked for"""
+
+        key = (student, slot)
+        if key not in self._grid_row_slot_cache:
+            self._grid_row_slot_cache[key] = self._get_grid_row_slot(student, slot)
+
+        return self._grid_row_slot_cache[key]
+
+    def _get_grid_row_slot(self, student: GridStudent, slot: GridSlot) -> GridRowSlot:
+        current_signup_data = self._signups_by_cell.get((slot.id, student.id))
+        current_signup: Optional[CurrentSelection] = None
+        if current_signup_data:
+            current_signup = CurrentSelection(
+                slot,
+                self.options_by_id[current_signup_data.option.id],
+                current_signup_data.admin_locked,
             )
 
-        for student in self.students:
-            for slot in self.slots:
-                key = (student, slot)
-                grid_row = get_grid_row(student, slot)
-                out[key] = grid_row
+        def is_editable() -> bool:
+            if slot.editable_until < timezone.now() and not self._edit_past_lockout:
+                return False
+
+            if (
+                current_signup_data
+                and current_signup_data.admin_locked
+                and not self._can_set_admin_locked
+            ):
+                return False
+
+            # If a student is set to an admin only option and the
+            # editor can't use admin only options, that's a lock
+            if (
+                current_signup
+                and current_signup.current_option.admin_only
+                and not self._alow_admin_only
+            ):
+                return False
+
+            return True
+
+        preferred_teachers = self.student_teacher_associations[(student, slot.date)]
+        preferred_options, remaining_options = self._partition_options(
+            slot, frozenset(preferred_teachers)
+        )
 
-        return out
+        return GridRowSlot(
+            student=student,
+            slot=slot,
+            currently_selected=current_signup,
+            preferred_options=preferred_options,
+            remaining_options=remaining_options,
+            editable=is_editable(),
+        )
+
+    @cached_property
+    def grid_row_slots(self) -> Dict[Tuple[GridStudent, GridSlot], GridRowSlot]:
+        return {
+            (student, slot): self.grid_row_slot(student, slot)
+            for student in self.students
+            for slot in self.slots
+        }
 
     @cached_property
     def rows(self) -> List[GridRow]:
@@ -493,7 +622,7 @@ class GridGenerator:
         out: List[GridRow] = []
 
         for student in self.students:
-            grid_rows = [self.grid_row_slots[(student, slot)] for slot in self.slots]
+            grid_rows = [self.grid_row_slot(student, slot) for slot in self.slots]
             out.append(GridRow(student=student, slots=grid_rows))
 
         return out
@@ -505,9 +634,7 @@ class GridGenerator:
         out: list[PivotedGridRow] = []
 
         for slot in self.slots:
-            grid_rows = [
-                self.grid_row_slots[(student, slot)] for student in self.students
-            ]
+            grid_rows = [self.grid_row_slot(student, slot) for student in self.students]
             out.append(PivotedGridRow(slot=slot, students=grid_rows))
 
         return out
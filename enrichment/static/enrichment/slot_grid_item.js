@@ -15,36 +15,57 @@ const mustInt = (val) => {
     return out;
 }
 
-const mustInts = (val) => {
-    if (val === "") {
-        return [];
-    }
-    const items = val.split(",")
-
-    return items.map((item) => mustInt(item));
+const CELL_EDITABLE = 1;
+const CELL_LOCKED = 2;
+
+// Unpack a single cell of the compact grid data, see GridGenerator.compact_jsonable
+const getCell = (grid, studentIndex, slotIndex) => {
+    const [preferredMask, currentIndex, flags] = grid.cells[studentIndex][slotIndex];
+    const slotOptions = grid.slot_options[slotIndex].map((i) => grid.options[i]);
+
+    // The mask can be wider than a Number, so it is sent in hex
+    const mask = BigInt(`0x${preferredMask}`);
+    const preferredOptions = slotOptions.filter((_, i) => (mask >> BigInt(i)) & 1n);
+    const remainingOptions = slotOptions.filter((_, i) => !((mask >> BigInt(i)) & 1n));
+
+    return {
+        slotId: grid.slots[slotIndex].id,
+        studentId: grid.students[studentIndex].id,
+        currentOptionId: currentIndex === null ? null : grid.options[currentIndex].id,
+        locked: (flags & CELL_LOCKED) !== 0,
+        editable: (flags & CELL_EDITABLE) !== 0,
+        preferredOptions,
+        remainingOptions,
+    };
 }
+
 document.addEventListener('DOMContentLoaded', () => {
-    const optionsById = JSON.parse(document.getElementById('all-options').textContent);
+    const table = document.querySelector(".slot-grid-table");
+    if (!table) {
+        return;
+    }
+
     const assignURL = JSON.parse(document.getElementById('assign-url').textContent);
     const csrfValue = JSON.parse(document.getElementById('csrf-token').textContent);
+    const optionsById = {};
 
-    document.querySelectorAll(".slot-grid-item.editable").forEach((elem) => {
+    const renderSlotGridItem = (cell, allowLocking) => {
         let editing = false;
         let saving = false;
 
-        const data = elem.dataset;
+        const slotId = cell.slotId;
+        const studentId = cell.studentId;
+        let currentOptionId = cell.currentOptionId;
+        let currentLocked = cell.locked;
+        let editable = cell.editable;
+        let preferredOptions = cell.preferredOptions;
+        let remainingOptions = cell.remainingOptions;
 
-        const slotId = mustInt(data.slotId);
-        const studentId = mustInt(data.studentId);
-        let currentOptionId = mustInt(data.currentItemId);
-        let currentLocked = mustInt(data.locked) === 1;
-        const preferredOptionIds = mustInts(data.preferredOptions);
-        const remainingOptionIds = mustInts(data.remainingOptions);
-        const preferredOptions = preferredOptionIds.map((id) => optionsById[id]);
-        const remainingOptions = remainingOptionIds.map((id) => optionsById[id]);
-        const allowLocking = mustInt(data.allowLocking) === 1;
+        const elem = document.createElement("span");
+        elem.classList.add("slot-grid-item", editable ? "editable" : "view-only");
 
-        const currentSelectionSpan = elem.getElementsByClassName("current-selection")[0];
+        const currentSelectionSpan = document.createElement("span");
+        currentSelectionSpan.classList.add("current-selection");
 
         const reset = () => {
             editing = false;
@@ -66,14 +87,17 @@ document.addEventListener('DOMContentLoaded', () => {
                 return icon;
             }
 
-            const elems = [getIcon("fa-solid", "fa-edit")];
+            const elems = [];
 
-            if (currentLocked) {
+            if (editable) {
+                elems.push(getIcon("fa-solid", "fa-edit"));
+            }
+
+            if (currentOptionId && currentLocked) {
                 elems.push(getSpace());
                 elems.push(getIcon("fa-solid", "fa-lock"));
             }
 
-
             elems.push(getSpace());
 
             if (currentOptionId && currentOptionId != 0) {
@@ -89,8 +113,27 @@ document.addEventListener('DOMContentLoaded', () => {
             elem.replaceChildren(...elems);
         }
 
+        // Take on the cell as the server worked it out after a save
+        const update = (grid) => {
+            for (const option of grid.options) {
+                optionsById[option.id] = option;
+            }
+
+            const updated = getCell(grid, 0, 0);
+            currentOptionId = updated.currentOptionId;
+            currentLocked = updated.locked;
+            editable = updated.editable;
+            preferredOptions = updated.preferredOptions;
+            remainingOptions = updated.remainingOptions;
+
+            elem.classList.toggle("editable", editable);
+            elem.classList.toggle("view-only", !editable);
+        }
+
+        reset();
+
         elem.addEventListener('click', (evt) => {
-            if (editing || saving) {
+            if (!editable || editing || saving) {
                 return;
             }
 
@@ -175,10 +218,102 @@ document.addEventListener('DOMContentLoaded', () => {
                     return;
                 }
 
-                currentOptionId = id;
-                currentLocked = locked;
+                update(respData.grid);
                 reset();
             });
         });
-    });
+
+        return elem;
+    };
+
+    const getHeader = (text) => {
+        const th = document.createElement("th");
+        th.innerText = text;
+        return th;
+    }
+
+    const getTd = (grid, studentIndex, slotIndex) => {
+        const td = document.createElement("td");
+        const cell = getCell(grid, studentIndex, slotIndex);
+        td.append(renderSlotGridItem(cell, grid.allow_locking));
+        return td;
+    }
+
+    // Turn one chunk of grid data into table rows, either with a row for
+    // each student or, for the pivoted layout, a row for each slot
+    const renderRows = (grid) => {
+        for (const option of grid.options) {
+            optionsById[option.id] = option;
+        }
+
+        const rows = [];
+
+        if (table.dataset.layout === "pivoted") {
+            grid.slots.forEach((slot, slotIndex) => {
+                const tr = document.createElement("tr");
+                tr.append(getHeader(slot.display));
+                grid.students.forEach((_, studentIndex) => tr.append(getTd(grid, studentIndex, slotIndex)));
+                rows.push(tr);
+            });
+        } else {
+            grid.students.forEach((student, studentIndex) => {
+                const tr = document.createElement("tr");
+                tr.append(getHeader(student.name));
+                grid.slots.forEach((_, slotIndex) => tr.append(getTd(grid, studentIndex, slotIndex)));
+                rows.push(tr);
+            });
+        }
+
+        return rows;
+    }
+
+    const tbody = table.tBodies[0];
+    const firstChunk = JSON.parse(document.getElementById('grid-data').textContent);
+    tbody.append(...renderRows(firstChunk));
+
+    if (!firstChunk.next_url) {
+        return;
+    }
+
+    // Further advisees are loaded in chunks as the end of the grid scrolls into view
+    const moreRow = document.createElement("tr");
+    const moreCell = document.createElement("td");
+    moreCell.colSpan = firstChunk.slots.length + 1;
+    moreCell.innerHTML = '<i class="fa-solid fa-spinner fa-spin"></i> Loading more advisees';
+    moreRow.append(moreCell);
+    moreRow.dataset.url = firstChunk.next_url;
+    tbody.append(moreRow);
+
+    const loadMoreRows = async (observer) => {
+        observer.unobserve(moreRow);
+
+        const resp = await fetch(moreRow.dataset.url, {
+            headers: { 'Accept': 'application/json' },
+        });
+
+        if (!resp.ok) {
+            moreCell.innerText = "Could not load more advisees, reload the page to try again";
+            return;
+        }
+
+        const chunk = await resp.json();
+        moreRow.before(...renderRows(chunk));
+
+        if (chunk.next_url) {
+            moreRow.dataset.url = chunk.next_url;
+            observer.observe(moreRow);
+        } else {
+            moreRow.remove();
+        }
+    };
+
+    const moreRowsObserver = new IntersectionObserver((entries, observer) => {
+        for (const entry of entries) {
+            if (entry.isIntersecting) {
+                loadMoreRows(observer);
+            }
+        }
+    }, { rootMargin: "500px" });
+
+    moreRowsObserver.observe(moreRow);
 });
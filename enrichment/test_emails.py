@@ -343,6 +343,8 @@ def test_advisor_unassigned():
 
 
 def _basic_setup():
+    slot_date = date(2022, 10, 11)  # Tuesday
+
     middle_school = blackbaud.models.School(
         sis_id=uuid4().hex,
         active=True,
@@ -391,7 +393,7 @@ def _basic_setup():
         section=section,
         teacher=teacher,
         school=middle_school,
-        begin_date=date.today() - timedelta(days=30),
+        begin_date=slot_date - timedelta(days=10),
         end_date=date.today() + timedelta(days=30),
     )
 
@@ -401,7 +403,7 @@ def _basic_setup():
         section=section,
         student=student,
         school=middle_school,
-        begin_date=date.today() - timedelta(days=30),
+        begin_date=slot_date - timedelta(days=10),
         end_date=date.today() + timedelta(days=30),
     )
 
@@ -409,7 +411,7 @@ def _basic_setup():
     blackbaud.models.AdvisorySchool.objects.create(school=middle_school)
 
     slot = Slot()
-    slot.date = date(2022, 10, 11)  # Tuesday
+    slot.date = slot_date
     slot.editable_until = datetime(
         slot.date.year,
         slot.date.month,
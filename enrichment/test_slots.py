@@ -0,0 +1,170 @@
+"""Tests for the enrichment grid"""
+
+from datetime import date, timedelta
+from uuid import uuid4
+
+import pytest
+
+import blackbaud.models
+
+from enrichment.models import Option, Slot
+from enrichment.slots import GridGenerator
+
+
+def _teacher(family_name: str) -> blackbaud.models.Teacher:
+    return blackbaud.models.Teacher.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Teacher",
+        family_name=family_name,
+        email=f"{family_name.lower()}@example.org",
+    )
+
+
+def _slots(count: int) -> list[Slot]:
+    first = date(2022, 10, 3)
+
+    return [
+        Slot.objects.create(date=first + timedelta(days=7 * i)) for i in range(count)
+    ]
+
+
+@pytest.mark.django_db
+def test_option_availability(django_assert_num_queries):
+    slots = _slots(5)
+
+    always = Option.objects.create(
+        teacher=_teacher("Always"), location="A", start_date=date(2022, 1, 1)
+    )
+    dated = Option.objects.create(
+        teacher=_teacher("Dated"),
+        location="B",
+        start_date=slots[1].date,
+        end_date=slots[3].date,
+    )
+    excluded = Option.objects.create(
+        teacher=_teacher("Excluded"), location="C", start_date=date(2022, 1, 1)
+    )
+    excluded.not_available_on.add(slots[0], slots[4])
+    only = Option.objects.create(
+        teacher=_teacher("Only"), location="D", start_date=slots[2].date
+    )
+    only.only_available_on.add(slots[1], slots[2], slots[3])
+    Option.objects.create(
+        teacher=_teacher("Finished"),
+        location="E",
+        start_date=date(2022, 1, 1),
+        end_date=date(2022, 6, 1),
+    )
+
+    grid = GridGenerator(None, slots, [])
+
+    # Options, location overrides and the two slot restriction tables. There are
+    # no students, so there are no signups to load
+    with django_assert_num_queries(4):
+        options_by_slot = grid.options_by_slot
+
+    available = {
+        slot.date: {option.id for option in options}
+        for slot, options in options_by_slot.items()
+    }
+
+    assert available == {
+        slots[0].date: {always.pk},
+        slots[1].date: {always.pk, dated.pk, excluded.pk},
+        slots[2].date: {always.pk, dated.pk, excluded.pk, only.pk},
+        slots[3].date: {always.pk, dated.pk, excluded.pk, only.pk},
+        slots[4].date: {always.pk},
+    }
+
+    # The masks agree with the checks on the options themselves
+    for slot, options in options_by_slot.items():
+        assert options == {
+            option for option in grid.all_options if option.is_available_for_slot(slot)
+        }
+
+
+@pytest.mark.django_db
+def test_grid_cells_share_option_partitions():
+    slots = _slots(2)
+    school = blackbaud.models.School.objects.create(name="Middle school", active=True)
+    course = blackbaud.models.Course.objects.create(
+        sis_id=uuid4().hex, active=True, title="Advisory"
+    )
+    section = blackbaud.models.Class.objects.create(
+        sis_id=uuid4().hex, active=True, title="Advisory", course=course, school=school
+    )
+
+    advisor = _teacher("Advisor")
+    blackbaud.models.TeacherEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        teacher=advisor,
+        section=section,
+        school=school,
+        begin_date=date(2022, 9, 1),
+        end_date=date(2023, 6, 1),
+    )
+
+    students = []
+    for name in ("Jimmy", "Cindy"):
+        student = blackbaud.models.Student.objects.create(
+            sis_id=uuid4().hex,
+            active=True,
+            given_name=name,
+            family_name="Neutron",
+            email=f"{name.lower()}@example.org",
+        )
+        blackbaud.models.StudentEnrollment.objects.create(
+            sis_id=uuid4().hex,
+            active=True,
+            student=student,
+            section=section,
+            school=school,
+            begin_date=date(2022, 9, 1),
+            end_date=date(2023, 6, 1),
+        )
+        students.append(student)
+
+    start_date = date(2022, 1, 1)
+    advisor_option = Option.objects.create(
+        teacher=advisor, location="A", start_date=start_date
+    )
+    others = [
+        Option.objects.create(
+            teacher=_teacher(name), location="B", start_date=start_date
+        )
+        for name in ("Zed", "Brown")
+    ]
+    admin_only = Option.objects.create(
+        teacher=_teacher("Admin"), location="C", start_date=start_date, admin_only=True
+    )
+
+    grid = GridGenerator(None, slots, students)
+    jimmy, cindy = (row.slots for row in grid.rows)
+
+    for jimmy_cell, cindy_cell in zip(jimmy, cindy):
+        assert jimmy_cell.preferred_option_ids == [advisor_option.pk]
+        assert jimmy_cell.remaining_option_ids == [others[1].pk, others[0].pk]
+
+        # Students with the same teachers on a slot share the same split
+        assert jimmy_cell.preferred_options is cindy_cell.preferred_options
+        assert jimmy_cell.remaining_options is cindy_cell.remaining_options
+
+    # Hiding admin only options from a cell leaves the slot's options alone
+    for options in grid.options_by_slot.values():
+        assert admin_only.pk in {option.id for option in options}
+
+    # The compact form lists each option once, in teacher order, and marks
+    # the preferred options on a slot with a mask over that slot's options
+    data = grid.compact_jsonable
+    assert [option["id"] for option in data["options"]] == [
+        admin_only.pk,
+        advisor_option.pk,
+        others[1].pk,
+        others[0].pk,
+    ]
+    assert data["slot_options"] == [[1, 2, 3], [1, 2, 3]]
+
+    # The slots are long past, so nothing is editable
+    assert data["cells"] == [[["1", None, 0], ["1", None, 0]]] * 2
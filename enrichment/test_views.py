@@ -0,0 +1,196 @@
+"""Tests for the enrichment assignment views"""
+
+from datetime import date, timedelta
+from uuid import uuid4
+
+import pytest
+
+from django.test import override_settings
+from django.urls import reverse
+
+import blackbaud.models
+
+from enrichment.models import Option, Signup, Slot
+
+
+def _advisory(student_count: int):
+    """An advisor with a number of advisees, and an option for them"""
+
+    school = blackbaud.models.School.objects.create(name="Middle school", active=True)
+    course = blackbaud.models.Course.objects.create(
+        sis_id=uuid4().hex, active=True, title="Advisory"
+    )
+    section = blackbaud.models.Class.objects.create(
+        sis_id=uuid4().hex, active=True, title="Advisory", course=course, school=school
+    )
+    teacher = blackbaud.models.Teacher.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        given_name="Adam",
+        family_name="Peacock",
+        email="teacher@example.org",
+    )
+
+    begin_date = date.today() - timedelta(days=30)
+    end_date = date.today() + timedelta(days=30)
+
+    blackbaud.models.TeacherEnrollment.objects.create(
+        sis_id=uuid4().hex,
+        active=True,
+        teacher=teacher,
+        section=section,
+        school=school,
+        begin_date=begin_date,
+        end_date=end_date,
+    )
+
+    students = []
+    for i in range(student_count):
+        student = blackbaud.models.Student.objects.create(
+            sis_id=uuid4().hex,
+            active=True,
+            given_name="Student",
+            family_name=f"{i:02d}",
+            email=f"student{i}@example.org",
+        )
+        student.schools.add(school)
+        blackbaud.models.StudentEnrollment.objects.create(
+            sis_id=uuid4().hex,
+            active=True,
+            student=student,
+            section=section,
+            school=school,
+            begin_date=begin_date,
+            end_date=end_date,
+        )
+        students.append(student)
+
+    blackbaud.models.AdvisoryCourse.objects.create(course=course)
+    blackbaud.models.AdvisorySchool.objects.create(school=school)
+
+    slot = Slot.objects.create(date=date.today())
+    option = Option.objects.create(
+        teacher=teacher, location="Library", start_date=begin_date
+    )
+
+    return students, slot, option
+
+
+@pytest.mark.django_db
+@override_settings(ENRICHMENT_GRID_PAGE_SIZE=2)
+def test_grid_rows_are_paginated(client, superuser, static_files):
+    students, slot, option = _advisory(3)
+    client.force_login(superuser)
+
+    url = reverse("enrichment:assign-all")
+    resp = client.get(url, {"date": slot.date.isoformat()})
+    assert resp.status_code == 200
+
+    first_page = resp.context["grid_data"]
+    assert [student["id"] for student in first_page["students"]] == [
+        students[0].pk,
+        students[1].pk,
+    ]
+
+    resp = client.get(url, {"date": slot.date.isoformat(), "after": students[0].pk})
+    assert resp.status_code == 200
+
+    data = resp.json()
+    assert [student["id"] for student in data["students"]] == [
+        students[1].pk,
+        students[2].pk,
+    ]
+    assert data["options"] == [{"id": option.pk, "display": "Adam Peacock"}]
+    assert [grid_slot["id"] for grid_slot in data["slots"]] == [slot.pk]
+    assert data["slot_options"] == [[0]]
+
+    # The option is preferred, nothing is assigned and the cell is editable
+    assert data["cells"] == [[["1", None, 1]], [["1", None, 1]]]
+
+    assert data["next_url"] is None
+
+    resp = client.get(first_page["next_url"])
+    data = resp.json()
+    assert [student["id"] for student in data["students"]] == [students[2].pk]
+    assert data["next_url"] is None
+
+
+@pytest.mark.django_db
+@override_settings(ENRICHMENT_GRID_PAGE_SIZE=2)
+def test_unassigned_grid_pages_survive_assignments(client, superuser, static_files):
+    students, slot, option = _advisory(5)
+    client.force_login(superuser)
+
+    url = reverse("enrichment:assign-unassigned")
+    resp = client.get(url, {"date": slot.date.isoformat()})
+    first_page = resp.context["grid_data"]
+    assert [student["id"] for student in first_page["students"]] == [
+        students[0].pk,
+        students[1].pk,
+    ]
+
+    # Fully assigning a student on the first page drops them from the view
+    Signup.objects.create(
+        slot=slot, student=students[0], option=option, admin_locked=False
+    )
+
+    resp = client.get(first_page["next_url"])
+    data = resp.json()
+    assert [student["id"] for student in data["students"]] == [
+        students[2].pk,
+        students[3].pk,
+    ]
+
+    # Once everyone is assigned, a chunk is still JSON rather than a redirect
+    for student in students[1:]:
+        Signup.objects.create(
+            slot=slot, student=student, option=option, admin_locked=False
+        )
+
+    resp = client.get(data["next_url"])
+    assert resp.status_code == 200
+    assert resp.json()["students"] == []
+    assert resp.json()["next_url"] is None
+
+
+@pytest.mark.django_db
+def test_grid_rows_reject_bad_pages(client, superuser):
+    _advisory(1)
+    client.force_login(superuser)
+
+    url = reverse("enrichment:assign-all")
+    assert client.get(url, {"after": "nope"}).status_code == 400
+    assert client.get(url, {"after": 0}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_assign_returns_updated_cell(client, superuser):
+    students, slot, option = _advisory(1)
+    client.force_login(superuser)
+
+    resp = client.post(
+        reverse("enrichment:assign-save"),
+        {
+            "slot_id": slot.pk,
+            "student_id": students[0].pk,
+            "option_id": option.pk,
+            "admin_lock": True,
+        },
+        content_type="application/json",
+    )
+
+    data = resp.json()
+    assert data["success"]
+    assert [s["id"] for s in data["grid"]["students"]] == [students[0].pk]
+    assert data["grid"]["options"][0]["id"] == option.pk
+
+    # Assigned to the only option and locked, and still editable
+    assert data["grid"]["cells"] == [[["1", 0, 3]]]
+
+    resp = client.post(
+        reverse("enrichment:assign-save"),
+        {"slot_id": slot.pk, "student_id": students[0].pk, "option_id": None},
+        content_type="application/json",
+    )
+
+    assert resp.json()["grid"]["cells"] == [[["1", None, 1]]]
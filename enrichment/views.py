@@ -6,6 +6,7 @@ import structlog
 from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple
 import urllib.parse
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.views import View
@@ -111,12 +112,7 @@ class AssignView(LoginRequiredMixin, BaseDateMixin, TemplateView):
         )
 
         return sorted(
-            {p.student for p in get_advisees(teachers)},
-            key=lambda student: (
-                student.family_name,
-                student.nickname,
-                student.given_name,
-            ),
+            {p.student for p in get_advisees(teachers)}, key=_student_sort_key
         )
 
     def get_base_date(self) -> date:
@@ -128,15 +124,65 @@ class AssignView(LoginRequiredMixin, BaseDateMixin, TemplateView):
 
         return get_monday()
 
-    def get_generator(self) -> GridGenerator:
-        return GridGenerator(self.user, self.slots, self.students)
+    def get_generator(self, students: Optional[List[Student]] = None) -> GridGenerator:
+        if students is None:
+            students = self.students
+
+        return GridGenerator(self.user, self.slots, students)
 
     def get(self, request, *args: Any, **kwargs: Any):
+        # Chunks are always JSON, even once there are no students left
+        if "after" in request.GET:
+            return self.get_rows(request)
+
         if not self.students:
             return HttpResponseRedirect(reverse("enrichment:index"))
 
         return super().get(request, *args, **kwargs)
 
+    def get_rows(self, request: HttpRequest) -> JsonResponse:
+        """A chunk of grid rows, for the students after a given student"""
+
+        try:
+            after_id = int(request.GET["after"])
+        except ValueError as exc:
+            raise SuspiciousOperation from exc
+
+        after = Student.objects.filter(pk=after_id).first()
+        if not after:
+            raise SuspiciousOperation("Unknown student to page after")
+
+        students, next_url = self.get_page(after)
+        grid = self.get_generator(students)
+
+        return JsonResponse({**grid.compact_jsonable, "next_url": next_url})
+
+    def get_page(
+        self, after: Optional[Student] = None
+    ) -> Tuple[List[Student], Optional[str]]:
+        """A page of students, and where the page after it is loaded from
+
+        Pages pick up after the last student of the previous page in sort
+        order, rather than at a position in the list, since the list can
+        change between pages. The unassigned view drops students as soon
+        as they are fully assigned, for one."""
+
+        students = self.students
+        if after:
+            after_key = _student_sort_key(after)
+            students = [obj for obj in students if _student_sort_key(obj) > after_key]
+
+        page_size = settings.ENRICHMENT_GRID_PAGE_SIZE
+        page = students[:page_size]
+
+        next_url: Optional[str] = None
+        if len(students) > page_size:
+            next_url = _replace_query(
+                self.request.get_full_path(), after=str(page[-1].pk)
+            )
+
+        return page, next_url
+
     def get_context_data(self, **kwargs) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
         base_date = self.get_base_date()
@@ -151,18 +197,18 @@ class AssignView(LoginRequiredMixin, BaseDateMixin, TemplateView):
         current_url = self.request.get_full_path()
 
         def get_week_jump(d: date) -> Tuple[str, date]:
-            url_parts = urllib.parse.urlparse(current_url)
-            query_params = dict(urllib.parse.parse_qsl(url_parts.query))
-            query_params.update({"date": d.strftime("%Y-%m-%d")})
-            encoded_query_params = urllib.parse.urlencode(query_params)
-            new_url_parts = url_parts._replace(query=encoded_query_params)
-
-            return new_url_parts.geturl(), d
+            return _replace_query(current_url, date=d.strftime("%Y-%m-%d")), d
 
         jumps = [get_week_jump(d) for d in jump_dates]
 
+        # Only the first chunk of advisees is worked out up front, and
+        # the rest are loaded from get_rows once the page is showing
+        students, next_url = self.get_page()
+        grid = self.get_generator(students)
+
         context["week_of"] = base_date
-        context["grid"] = self.get_generator()
+        context["grid"] = grid
+        context["grid_data"] = {**grid.compact_jsonable, "next_url": next_url}
         context["jump_weeks"] = jumps
         context["title"] = self.get_title()
 
@@ -178,10 +224,7 @@ class AssignAllView(AssignAllPermissionRequired, AssignView):
     @cached_property
     def students(self) -> List[Student]:
         all_students = {pair.student for pair in get_advisees()}
-        return sorted(
-            all_students,
-            key=lambda obj: (obj.family_name, obj.nickname, obj.given_name),
-        )
+        return sorted(all_students, key=_student_sort_key)
 
 
 class AssignForAdvisorView(AssignOtherAdviseePermissionRequired, AssignView):
@@ -198,7 +241,7 @@ class AssignForAdvisorView(AssignOtherAdviseePermissionRequired, AssignView):
     def students(self) -> List[Student]:
         students = sorted(
             {pair.student for pair in get_advisees([self.teacher])},
-            key=lambda obj: (obj.family_name, obj.nickname, obj.given_name),
+            key=_student_sort_key,
         )
 
         return students
@@ -498,7 +541,7 @@ def assign(request: HttpRequest) -> JsonResponse:
     grid_slot = generator.slots_by_id[SlotID(data.slot_id)]
     grid_student = generator.students_by_id[StudentID(data.student_id)]
 
-    config = generator.grid_row_slots[(grid_student, grid_slot)]
+    config = generator.grid_row_slot(grid_student, grid_slot)
 
     if not config.editable:
         return JsonResponse(
@@ -510,7 +553,7 @@ def assign(request: HttpRequest) -> JsonResponse:
 
     if not option:
         Signup.objects.filter(slot=slot, student=student).delete()
-        return JsonResponse({"success": True})
+        return _assigned_response(request.user, slot, student)
 
     all_options = config.preferred_options + config.remaining_options
     all_option_ids = [int(obj.id) for obj in all_options]
@@ -542,7 +585,35 @@ def assign(request: HttpRequest) -> JsonResponse:
     signup.option = option
     signup.save()
 
-    return JsonResponse({"success": True})
+    return _assigned_response(request.user, slot, student)
+
+
+def _assigned_response(
+    user: accounts.models.User, slot: Slot, student: Student
+) -> JsonResponse:
+    """A successful assignment, with the cell as it now stands
+    so that the grid can be updated without being reloaded"""
+
+    generator = GridGenerator(user, [slot], [student])
+
+    return JsonResponse({"success": True, "grid": generator.compact_jsonable})
+
+
+def _student_sort_key(student: Student) -> tuple:
+    """The order of students in the assignment grids, which is
+    also what the grids are paged by, so it must be unique"""
+
+    return student.family_name, student.nickname, student.given_name, student.pk
+
+
+def _replace_query(url: str, **params: str) -> str:
+    url_parts = urllib.parse.urlparse(url)
+    query_params = dict(urllib.parse.parse_qsl(url_parts.query))
+    query_params.update(params)
+    encoded_query_params = urllib.parse.urlencode(query_params)
+    new_url_parts = url_parts._replace(query=encoded_query_params)
+
+    return new_url_parts.geturl()
 
 
 def _parse_date(s: str) -> date: